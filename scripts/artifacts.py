@@ -0,0 +1,314 @@
+"""
+artifacts.py
+------------
+
+Content-addressed store for everything a job writes to `out/` (script,
+image, narration and timings, video, preview, thumbnail). When a file stage
+finishes its outputs are hashed and filed as blobs:
+
+    out/<slug>.mp4  <->  state/artifacts/<sha256[:2]>/<sha256>.mp4
+
+The `out/` file and the blob are hardlinks to the same inode, so a file
+costs its bytes once however often identical content is produced (a cached
+image or narration reused by a re-run links to the existing blob). The
+`artifacts` table of the state database is the manifest mapping each job and
+role to its blob.
+
+A stage that runs again first unlinks the job's previous outputs of that
+stage (`detach`), so renderers and encoders that overwrite a file in place
+never write through a link into a stored blob.
+
+`out/` itself is disposable: before a job's stages are checked and before a
+delivery reads its files, `restore` links whatever is missing back from the
+blobs, so a runner that only kept `state/` (the CI cache) resumes jobs and
+delivers queued posts without producing anything again.
+
+Retention runs at the end of every production run (`collect`) and only
+touches finished jobs, i.e. published or skipped on every target:
+
+* only the newest `ARTIFACT_KEEP_PER_SERIES` parts of a series keep their files;
+* while the stored blobs exceed `ARTIFACT_MAX_MB`, the oldest finished jobs
+  are dropped as well.
+
+Dropping a job removes its `out/` files and manifest rows; the garbage
+collector then deletes blobs no manifest row refers to, including those left
+behind by re-renders. Run both by hand with:
+
+    python -m scripts.artifacts gc [--dry-run]
+
+Environment variables
+---------------------
+ARTIFACT_DIR              Blob store location (default `state/artifacts`).
+ARTIFACT_KEEP_PER_SERIES  Finished parts per series whose files are kept (default 5; 0 = all).
+ARTIFACT_MAX_MB           Upper bound for the stored blobs (default 2000; 0 = no bound).
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from . import state
+from .util import ensure_dir
+
+# blobs younger than this are never collected: a concurrent run may be about to record them
+_GC_GRACE = 3600
+_CHUNK = 1 << 20
+
+
+class Removal(NamedTuple):
+    jobs: List[str]
+    blobs: int
+    bytes: int
+
+
+def _store_dir() -> str:
+    return os.environ.get("ARTIFACT_DIR", os.path.join("state", "artifacts"))
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def blob_path(digest: str, ext: str = "") -> str:
+    return os.path.join(_store_dir(), digest[:2], f"{digest}{ext}")
+
+
+def _link_into(src: str, dst: str) -> None:
+    """Make `dst` a hardlink to `src`, replacing whatever `dst` was."""
+    tmp = f"{dst}.lnk.{os.getpid()}"
+    os.link(src, tmp)
+    os.replace(tmp, dst)
+
+
+def find_blob(digest: str) -> Optional[str]:
+    """The stored blob for `digest` (whatever extension it was filed with), or None."""
+    folder = os.path.dirname(blob_path(digest))
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return None
+    for name in names:
+        if name.split(".", 1)[0] == digest and not name.endswith(".tmp"):
+            return os.path.join(folder, name)
+    return None
+
+
+def _store(path: str, digest: str) -> str:
+    """File `path` under `digest` and return the blob path."""
+    blob = find_blob(digest) or blob_path(digest, os.path.splitext(path)[1])
+    ensure_dir(os.path.dirname(blob))
+    if not os.path.exists(blob):
+        try:
+            os.link(path, blob)
+            return blob
+        except FileExistsError:
+            pass  # stored by another thread meanwhile
+        except OSError:
+            # store on another filesystem (or no hardlinks): keep a copy instead
+            tmp = f"{blob}.tmp.{os.getpid()}"
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, blob)
+            return blob
+    if not os.path.samefile(path, blob):
+        try:
+            # identical content is already stored: keep one inode for both
+            _link_into(blob, path)
+        except OSError:
+            pass
+    return blob
+
+
+def record(job_id: str, stage: str, files: Dict[str, str]) -> None:
+    """Store the outputs of `stage` (role -> path) and map them to `job_id`."""
+    rows = []
+    for role, path in files.items():
+        if not path or not os.path.isfile(path):
+            continue
+        digest = file_hash(path)
+        _store(path, digest)
+        rows.append((job_id, role, stage, path, digest, os.path.getsize(path), time.time()))
+    if not rows:
+        return
+    with state.transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO artifacts (job_id, role, stage, path, sha256, size, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+
+def restore(job_id: str) -> int:
+    """
+    Link the recorded files of `job_id` that are missing from `out/` (e.g. on a
+    fresh CI runner) back from their blobs. Returns how many were restored.
+    """
+    restored = 0
+    for artifact in job_artifacts(job_id).values():
+        path = artifact["path"]
+        blob = None if os.path.exists(path) else find_blob(artifact["sha256"])
+        if blob is None:
+            continue
+        ensure_dir(os.path.dirname(path) or ".")
+        try:
+            _link_into(blob, path)
+        except OSError:
+            tmp = f"{path}.tmp.{os.getpid()}"
+            shutil.copyfile(blob, tmp)
+            os.replace(tmp, path)
+        restored += 1
+    return restored
+
+
+def detach(job_id: str, stage: str) -> None:
+    """Unlink the recorded outputs of `stage` that share their inode with a blob, before it runs again."""
+    rows = state.connect().execute(
+        "SELECT path FROM artifacts WHERE job_id = ? AND stage = ?", (job_id, stage)
+    ).fetchall()
+    for r in rows:
+        try:
+            if os.stat(r["path"]).st_nlink > 1:
+                os.remove(r["path"])
+        except FileNotFoundError:
+            pass
+
+
+def job_artifacts(job_id: str) -> Dict[str, Dict]:
+    rows = state.connect().execute(
+        "SELECT * FROM artifacts WHERE job_id = ? ORDER BY created_at", (job_id,)
+    ).fetchall()
+    return {r["role"]: dict(r) for r in rows}
+
+
+def stored_bytes() -> int:
+    row = state.connect().execute(
+        "SELECT COALESCE(SUM(size), 0) AS n FROM (SELECT MAX(size) AS size FROM artifacts GROUP BY sha256)"
+    ).fetchone()
+    return row["n"]
+
+
+# -------- Retention and garbage collection --------
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name) or default)
+
+
+def expired_jobs(keep: Optional[int] = None, max_bytes: Optional[int] = None) -> List[str]:
+    """Finished jobs whose files the retention policy drops, in the order they go."""
+    if keep is None:
+        keep = _env_int("ARTIFACT_KEEP_PER_SERIES", 5)
+    if max_bytes is None:
+        max_bytes = int(float(os.environ.get("ARTIFACT_MAX_MB") or 2000) * 1024 * 1024)
+    conn = state.connect()
+    jobs = conn.execute(
+        "SELECT id, series_key, status FROM jobs WHERE id IN (SELECT job_id FROM artifacts) "
+        "ORDER BY series_key, part DESC"
+    ).fetchall()
+    blobs: Dict[str, Dict] = {}
+    for r in conn.execute("SELECT job_id, sha256, size FROM artifacts").fetchall():
+        blob = blobs.setdefault(r["sha256"], {"size": r["size"], "jobs": set()})
+        blob["jobs"].add(r["job_id"])
+
+    expired, kept, seen = [], [], {}
+    for job in jobs:
+        rank = seen[job["series_key"]] = seen.get(job["series_key"], -1) + 1
+        if job["status"] != "done":
+            continue
+        (expired if keep > 0 and rank >= keep else kept).append(job["id"])
+
+    def drop(jid):
+        for blob in blobs.values():
+            blob["jobs"].discard(jid)
+
+    for jid in expired:
+        drop(jid)
+    if max_bytes > 0:
+        total = sum(b["size"] for b in blobs.values() if b["jobs"])
+        oldest_first = conn.execute(
+            f"SELECT id FROM jobs WHERE id IN ({','.join('?' * len(kept))}) ORDER BY updated_at", kept
+        ).fetchall() if kept else []
+        for r in oldest_first:
+            if total <= max_bytes:
+                break
+            before = {d for d, b in blobs.items() if b["jobs"]}
+            drop(r["id"])
+            total -= sum(blobs[d]["size"] for d in before if not blobs[d]["jobs"])
+            expired.append(r["id"])
+    return expired
+
+
+def drop_job(job_id: str) -> None:
+    """Delete a job's `out/` files and manifest rows; its blobs are left to `collect_garbage`."""
+    for artifact in job_artifacts(job_id).values():
+        try:
+            os.remove(artifact["path"])
+        except FileNotFoundError:
+            pass
+    with state.transaction() as conn:
+        conn.execute("DELETE FROM artifacts WHERE job_id = ?", (job_id,))
+
+
+def collect_garbage(dry_run: bool = False) -> Removal:
+    """Delete blobs that no manifest row refers to. Returns what was (or would be) removed."""
+    root = _store_dir()
+    if not os.path.isdir(root):
+        return Removal([], 0, 0)
+    referenced = {r["sha256"] for r in state.connect().execute("SELECT DISTINCT sha256 FROM artifacts")}
+    cutoff = time.time() - _GC_GRACE
+    blobs = size = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if name.split(".", 1)[0] in referenced or st.st_mtime > cutoff:
+                continue
+            blobs += 1
+            # a blob still linked from out/ frees nothing here, the out/ file keeps it alive
+            size += st.st_size if st.st_nlink == 1 else 0
+            if not dry_run:
+                os.remove(path)
+    return Removal([], blobs, size)
+
+
+def collect(dry_run: bool = False) -> Removal:
+    """Apply the retention policy, then collect the blobs it released."""
+    expired = expired_jobs()
+    if not dry_run:
+        for jid in expired:
+            drop_job(jid)
+    garbage = collect_garbage(dry_run)
+    if expired or garbage.blobs:
+        verb = "Would remove" if dry_run else "Removed"
+        print(f"{verb} files of {len(expired)} finished jobs and {garbage.blobs} blobs "
+              f"({garbage.bytes / 1e6:.1f} MB)")
+    return Removal(expired, garbage.blobs, garbage.bytes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Moneybot Shorts artifact store")
+    parser.add_argument("command", choices=("gc", "ls"), help="gc: apply retention and delete unreferenced blobs; ls: list stored jobs")
+    parser.add_argument("--dry-run", action="store_true", help="report what gc would remove without deleting")
+    args = parser.parse_args(argv)
+
+    if args.command == "gc":
+        collect(dry_run=args.dry_run)
+    else:
+        rows = state.connect().execute(
+            "SELECT job_id, COUNT(*) AS files, SUM(size) AS size FROM artifacts GROUP BY job_id ORDER BY job_id"
+        ).fetchall()
+        for r in rows:
+            print(f"  {r['job_id']}  {r['files']} files, {r['size'] / 1e6:.1f} MB")
+    print(f"Stored: {stored_bytes() / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
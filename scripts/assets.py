@@ -0,0 +1,72 @@
+"""
+assets.py
+---------
+
+Asset preparation between the image/audio stages and rendering. The
+background image is decoded once, cover-cropped to the render geometry and
+upscaled to the Ken Burns master (render size times the largest zoom and the
+oversampling factor, see `zoom.py`), then stored as a raw RGBX `.npy` array
+next to the image:
+
+    out/<slug>.jpg  ->  out/<slug>.bg.npy
+
+Renderers (including every chunk worker) memory-map that file and hand it to
+`KenBurns` without copying, so the pixels live once in the page cache instead
+of being decoded and resampled again in every render process. The pipeline
+deletes the master once the video is rendered; a render that finds it missing
+or outdated prepares it again.
+"""
+
+import os
+
+import numpy as np
+from PIL import Image
+
+from . import audio
+from .zoom import load_background, master_shape
+
+# Shorts must stay under 30 seconds
+MAX_DURATION = 29.5
+
+
+def render_duration(audio_path: str) -> float:
+    return min(MAX_DURATION, audio.probe(audio_path).duration)
+
+
+def background_path(image_path: str) -> str:
+    return os.path.splitext(image_path)[0] + ".bg.npy"
+
+
+def _is_current(path: str, image_path: str, shape) -> bool:
+    try:
+        if os.path.getmtime(path) < os.path.getmtime(image_path):
+            return False
+        return np.load(path, mmap_mode="r").shape == shape
+    except (OSError, ValueError):
+        return False
+
+
+def prepare_background(image_path: str, duration: float) -> str:
+    """Write the Ken Burns master for `image_path` unless an up-to-date one exists."""
+    path = background_path(image_path)
+    h, w = master_shape(duration)
+    if _is_current(path, image_path, (h, w, 4)):
+        return path
+    master = load_background(image_path).resize((w, h), Image.LANCZOS).convert("RGBX")
+    tmp = f"{path}.tmp.{os.getpid()}.npy"
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8, shape=(h, w, 4))
+    out[...] = np.asarray(master)
+    out.flush()
+    del out, master
+    os.replace(tmp, path)
+    return path
+
+
+def prepare_assets(image_path: str, audio_path: str) -> str:
+    """Pipeline stage: prepare everything the renderer maps; returns the background path."""
+    return prepare_background(image_path, render_duration(audio_path))
+
+
+def background(image_path: str, duration: float) -> np.ndarray:
+    """Memory-mapped (H, W, 4) master for `image_path`, prepared first if needed."""
+    return np.load(prepare_background(image_path, duration), mmap_mode="r")
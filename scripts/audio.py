@@ -0,0 +1,179 @@
+"""
+audio.py
+--------
+
+Identify narration audio and read its duration straight from the container
+headers, so rendering neither decodes the file nor spawns an ffmpeg probe:
+
+* ADTS AAC: sum of the samples in every frame header
+* Ogg Opus: last granule position minus the pre-skip, at 48 kHz
+* WAV: data chunk size over the byte rate
+
+Anything else (e.g. MP3) falls back to `ffmpeg.probe_duration`.
+`mp4_audio_args` picks `-c:a copy` for codecs an MP4 can hold as they are.
+
+Narration synthesized per sentence comes with a timing manifest, stored next
+to the audio as `<audio>.timings.json` (`save_timings` / `load_timings`),
+which the subtitle builder uses instead of splitting the duration evenly.
+"""
+
+import json
+import os
+import struct
+import subprocess
+import wave
+from typing import List, NamedTuple, Optional
+
+# codecs that can be stream-copied into an MP4
+MP4_COPY = ("aac", "opus", "mp3")
+EXTENSIONS = {"aac": ".aac", "opus": ".opus", "mp3": ".mp3", "wav": ".wav", "flac": ".flac"}
+
+_ADTS_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+
+
+class AudioInfo(NamedTuple):
+    codec: str
+    duration: float
+
+
+class Timing(NamedTuple):
+    """One spoken sentence, `start`..`end` seconds into the narration."""
+    start: float
+    end: float
+    text: str
+
+
+def detect_format(head: bytes) -> Optional[str]:
+    """Codec name from the first bytes of a file, or None if unknown."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"OggS":
+        return "opus" if b"OpusHead" in head[:64] else "ogg"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:3] == b"ID3":
+        return "mp3"
+    if len(head) >= 2 and head[0] == 0xFF:
+        # both ADTS and MPEG audio start with an 11/12-bit sync word; ADTS has layer bits 00
+        if head[1] & 0xF6 == 0xF0:
+            return "aac"
+        if head[1] & 0xE0 == 0xE0:
+            return "mp3"
+    return None
+
+
+def extension(codec: str) -> str:
+    return EXTENSIONS.get(codec, ".audio")
+
+
+def _adts_duration(data: bytes) -> float:
+    pos, samples, rate = 0, 0, None
+    while pos + 7 <= len(data):
+        if data[pos] != 0xFF or data[pos + 1] & 0xF6 != 0xF0:
+            raise ValueError(f"lost ADTS sync at byte {pos}")
+        rate = _ADTS_RATES[(data[pos + 2] >> 2) & 0x0F]
+        length = ((data[pos + 3] & 0x03) << 11) | (data[pos + 4] << 3) | (data[pos + 5] >> 5)
+        if length < 7:
+            raise ValueError("corrupt ADTS frame")
+        samples += 1024 * ((data[pos + 6] & 0x03) + 1)
+        pos += length
+    if rate is None:
+        raise ValueError("no ADTS frames")
+    return samples / rate
+
+
+def _opus_duration(data: bytes) -> float:
+    head = data.find(b"OpusHead")
+    last = data.rfind(b"OggS")
+    if head < 0 or last < 0:
+        raise ValueError("not an Ogg Opus stream")
+    pre_skip = struct.unpack_from("<H", data, head + 10)[0]
+    granule = struct.unpack_from("<q", data, last + 6)[0]
+    return max(0, granule - pre_skip) / 48000
+
+
+def _wav_duration(path: str) -> float:
+    with wave.open(path, "rb") as w:
+        return w.getnframes() / w.getframerate()
+
+
+def probe(path: str) -> AudioInfo:
+    """Codec and duration of `path`, from its headers where the format allows."""
+    with open(path, "rb") as f:
+        codec = detect_format(f.read(64))
+        try:
+            if codec == "aac":
+                f.seek(0)
+                return AudioInfo(codec, _adts_duration(f.read()))
+            if codec == "opus":
+                f.seek(0)
+                return AudioInfo(codec, _opus_duration(f.read()))
+            if codec == "wav":
+                return AudioInfo(codec, _wav_duration(path))
+        except (ValueError, struct.error, wave.Error, EOFError):
+            pass
+    from .ffmpeg import probe_duration
+    return AudioInfo(codec or "unknown", probe_duration(path))
+
+
+def mp4_audio_args(info: AudioInfo):
+    """Audio codec arguments for muxing into an MP4: copy when possible, else AAC."""
+    if info.codec in MP4_COPY:
+        return ["-c:a", "copy"]
+    return ["-c:a", "aac", "-b:a", "160k"]
+
+
+def encode_pcm(pcm: bytes, rate: int, codec: str, path: str) -> None:
+    """Write 16-bit mono PCM as `codec` (aac, opus, mp3 or wav) to `path`; a failed encode leaves no file."""
+    tmp = f"{path}.tmp.{os.getpid()}"
+    try:
+        if codec == "wav":
+            with wave.open(tmp, "wb") as w:
+                w.setnchannels(1)
+                w.setsampwidth(2)
+                w.setframerate(rate)
+                w.writeframes(pcm)
+        else:
+            from .ffmpeg import ffmpeg_exe
+
+            encoder, muxer = {"aac": ("aac", "adts"), "opus": ("libopus", "ogg"), "mp3": ("libmp3lame", "mp3")}[codec]
+            proc = subprocess.run(
+                [ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y",
+                 "-f", "s16le", "-ar", str(rate), "-ac", "1", "-i", "-",
+                 "-c:a", encoder, "-b:a", "128k", "-f", muxer, tmp],
+                input=pcm, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            )
+            if proc.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed: {proc.stderr.decode('utf-8', 'replace').strip()}")
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# -------- Timing manifest --------
+
+def timings_path(audio_path: str) -> str:
+    return f"{audio_path}.timings.json"
+
+
+def save_timings(audio_path: str, timings: List[Timing]) -> None:
+    from .util import write_json
+
+    write_json(timings_path(audio_path), [t._asdict() for t in timings])
+
+
+def load_timings(audio_path: str) -> Optional[List[Timing]]:
+    """Sentence timings recorded with `audio_path`, or None for whole-script narration."""
+    try:
+        with open(timings_path(audio_path), "r", encoding="utf-8") as f:
+            return [Timing(t["start"], t["end"], t["text"]) for t in json.load(f)]
+    except FileNotFoundError:
+        return None
+
+
+def drop_timings(audio_path: str) -> None:
+    try:
+        os.remove(timings_path(audio_path))
+    except FileNotFoundError:
+        pass
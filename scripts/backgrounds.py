@@ -0,0 +1,153 @@
+"""
+backgrounds.py
+--------------
+
+Background library per series. Image prompts for one (mode, seed) only
+differ by "Part N", so instead of a gpt-image-1 call for every part the first
+parts fill a small bank of images and later parts reuse them:
+
+* Every bank image is indexed in the `backgrounds` table of the state
+  database with a 64-bit difference hash (dHash).
+* A reused image must be at least `BACKGROUND_MIN_DISTANCE` bits away from
+  the one the series used last, so consecutive parts never get the same or a
+  near-identical background; among those the least used one wins. Every
+  second reuse of an image is mirrored for variety.
+* A fresh image that is a near-duplicate of a bank image is used for its part
+  but not added to the bank.
+
+Bank images live outside `out/`, so they survive cleanup of rendered artifacts.
+
+Environment variables
+---------------------
+BACKGROUND_BANK_SIZE     Images generated per series before reuse starts (default 4;
+                         0 = a fresh image for every part, as before).
+BACKGROUND_FRESH_EVERY   Once the bank is full, every Nth part still gets a fresh
+                         image, which joins the bank (default 0 = never).
+BACKGROUND_MIN_DISTANCE  dHash bits below which two images count as near-duplicates (default 10).
+BACKGROUND_DIR           Where bank images are kept (default `state/backgrounds`).
+"""
+
+import hashlib
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+from . import state
+from .util import ensure_dir
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, str(default)))
+
+
+def library_key(mode: str, seed: str) -> str:
+    return f"{mode}:{seed}"
+
+
+def dhash(path: str) -> int:
+    """64-bit difference hash: brighter-than-right-neighbour bits of a 9x8 grey thumbnail."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        # let the JPEG decoder downscale while decoding
+        img.draft("L", (64, 64))
+        px = list(img.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return bits
+
+
+def distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def entries(library: str) -> List[Dict]:
+    rows = state.connect().execute(
+        "SELECT * FROM backgrounds WHERE library = ? ORDER BY id", (library,)
+    ).fetchall()
+    return [{**dict(r), "dhash": int(r["dhash"], 16)} for r in rows]
+
+
+def _fresh_due(part: int, bank: List[Dict]) -> bool:
+    if len(bank) < _env_int("BACKGROUND_BANK_SIZE", 4):
+        return True
+    every = _env_int("BACKGROUND_FRESH_EVERY", 0)
+    return every > 0 and part % every == 0
+
+
+def _write_variant(src: str, out_path: str, mirror: bool) -> None:
+    if not mirror:
+        shutil.copyfile(src, out_path)
+        return
+    from PIL import Image, ImageOps
+
+    with Image.open(src) as img:
+        ImageOps.mirror(img.convert("RGB")).save(out_path, "JPEG", quality=92)
+
+
+def pick(mode: str, seed: str, part: int, out_path: str) -> bool:
+    """
+    Write a background for `part` from the series bank to `out_path`.
+    Returns False when a fresh image should be generated instead.
+    """
+    if _env_int("BACKGROUND_BANK_SIZE", 4) <= 0:
+        return False
+    library = library_key(mode, seed)
+    min_distance = _env_int("BACKGROUND_MIN_DISTANCE", 10)
+    with state.transaction() as conn:
+        rows = conn.execute("SELECT * FROM backgrounds WHERE library = ?", (library,)).fetchall()
+        bank = [r for r in rows if os.path.isfile(r["path"])]
+        if _fresh_due(part, bank):
+            return False
+        used = [r for r in bank if r["last_used_at"] is not None]
+        last = max(used, key=lambda r: r["last_used_at"]) if used else None
+        candidates = [
+            r for r in bank
+            if last is None or (r["id"] != last["id"]
+                                and distance(int(r["dhash"], 16), int(last["dhash"], 16)) >= min_distance)
+        ]
+        if not candidates:
+            return False
+        choice = min(candidates, key=lambda r: (r["uses"], r["last_used_at"] or 0, r["id"]))
+        conn.execute(
+            "UPDATE backgrounds SET uses = uses + 1, last_part = ?, last_used_at = ? WHERE id = ?",
+            (part, time.time(), choice["id"]),
+        )
+    # the bank image was generated for its own part; every second reuse is mirrored
+    _write_variant(choice["path"], out_path, mirror=choice["uses"] % 2 == 1)
+    print(f"Background for part {part} reused from the {library} bank ({len(bank)} images)")
+    return True
+
+
+def add(mode: str, seed: str, part: int, image_path: str) -> Optional[int]:
+    """
+    Index a freshly generated background and keep a copy in the bank, unless
+    it is a near-duplicate of one already there. Returns the entry id.
+    """
+    if _env_int("BACKGROUND_BANK_SIZE", 4) <= 0:
+        return None
+    library = library_key(mode, seed)
+    h = dhash(image_path)
+    now = time.time()
+    for e in entries(library):
+        if distance(h, e["dhash"]) < _env_int("BACKGROUND_MIN_DISTANCE", 10):
+            # counts as a use of the existing image for the next part's near-duplicate check
+            with state.transaction() as conn:
+                conn.execute("UPDATE backgrounds SET last_part = ?, last_used_at = ? WHERE id = ?",
+                             (part, now, e["id"]))
+            return e["id"]
+    folder = os.path.join(os.environ.get("BACKGROUND_DIR", os.path.join("state", "backgrounds")),
+                          hashlib.sha1(library.encode("utf-8")).hexdigest()[:12])
+    ensure_dir(folder)
+    path = os.path.join(folder, f"{h:016x}{os.path.splitext(image_path)[1]}")
+    shutil.copyfile(image_path, path)
+    with state.transaction() as conn:
+        cur = conn.execute(
+            "INSERT INTO backgrounds (library, path, dhash, uses, last_part, created_at, last_used_at) "
+            "VALUES (?, ?, ?, 1, ?, ?, ?)",
+            (library, path, f"{h:016x}", part, now, now),
+        )
+    return cur.lastrowid
@@ -0,0 +1,216 @@
+"""
+bench.py
+--------
+
+Offline benchmark for the whole `scripts.main` flow. OpenAI, the Bluesky PDS
+and the YouTube upload endpoint are replaced by local fake servers (see
+`fakes.py`), so no API keys are needed and nothing is posted, while the real
+publish code runs. Each run happens in a fresh temporary working directory.
+
+Reports per-stage wall time (from the `trace.py` spans), render frames per
+second, peak RSS, output size and cold-start cost (importing `scripts.main`,
+running `--plan`) for N topics, and writes them as JSON:
+
+    python -m scripts.bench --topics 3 --latency image=2,chat=0.5 --fail-rate 0.1 --out bench.json
+
+`--latency` and `--fail-rate` take either one number for every endpoint or
+`name=value` pairs for chat, image, speech, bluesky, bluesky_lost, youtube (upload start),
+youtube_chunk and youtube_expire. The YouTube figures show resumed uploads
+(status queries for a saved session), expired sessions that were restarted,
+and whether every uploaded video matches its render byte for byte. The
+report goes to `logs/bench_output.json` unless `--out` says otherwise.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+def _per_endpoint(value: str):
+    if not value:
+        return {}
+    if "=" not in value:
+        return {"*": float(value)}
+    pairs = (item.split("=", 1) for item in value.split(",") if item.strip())
+    return {k.strip(): float(v) for k, v in pairs}
+
+
+def _stage_summary(records):
+    out = {}
+    for r in records:
+        if r.get("event") != "stage":
+            continue
+        s = out.setdefault(r["stage"], {"calls": 0, "failures": 0, "total_s": 0.0, "max_s": 0.0,
+                                        "retries": 0, "bytes_in": 0, "bytes_out": 0})
+        s["calls"] += 1
+        s["failures"] += 0 if r["ok"] else 1
+        s["total_s"] += r["duration_s"]
+        s["max_s"] = max(s["max_s"], r["duration_s"])
+        s["retries"] += r["retries"]
+        s["bytes_in"] += r["bytes_in"]
+        s["bytes_out"] += r["bytes_out"]
+    for s in out.values():
+        s["mean_s"] = round(s["total_s"] / s["calls"], 4)
+        s["total_s"] = round(s["total_s"], 4)
+    return out
+
+
+@contextmanager
+def _environ(**values):
+    saved = {k: os.environ.get(k) for k in values}
+    os.environ.update({k: str(v) for k, v in values.items()})
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _sha256_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return _sha256(f.read())
+
+
+def _rss_mb(who) -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+
+def _cold_start(repeat: int = 3) -> dict:
+    """Best-of-N seconds for a fresh interpreter to import `scripts.main` and to run `--plan`."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": root}
+    timer = "import time; t = time.perf_counter(); import scripts.main; print(time.perf_counter() - t)"
+    imports = [float(subprocess.run([sys.executable, "-c", timer], env=env, cwd=root, check=True,
+                                    capture_output=True, text=True).stdout) for _ in range(repeat)]
+    plans = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "scripts.main", "--plan"], env=env, check=True, capture_output=True)
+        plans.append(time.perf_counter() - start)
+    return {"import_main_s": round(min(imports), 4), "plan_s": round(min(plans), 4)}
+
+
+def run_benchmark(topics: int = 3, latency=None, fail_rate=None, engine: str = "ffmpeg",
+                  workers: int = 1, use_cache: bool = False, seed: int = 0) -> dict:
+    from . import fakes
+
+    faults = fakes.Faults(latency, fail_rate, seed)
+    workdir = tempfile.mkdtemp(prefix="moneybot-bench-")
+    cwd = os.getcwd()
+    seeds = ",".join(f"Bench Series {i + 1}" for i in range(topics))
+    with fakes.FakeOpenAI(faults) as server, fakes.FakeBluesky(faults) as pds, \
+            fakes.FakeYouTube(faults) as yt, _environ(
+        OPENAI_API_KEY="bench",
+        OPENAI_BASE_URL=server.base_url,
+        # the real post_bluesky runs against the fake PDS
+        BLUESKY_HANDLE="bench.fake",
+        BLUESKY_APP_PASSWORD="bench",
+        BLUESKY_SERVICE=pds.base_url,
+        # and the real chunked YouTube uploader against the fake upload endpoint
+        YT_CLIENT_ID="bench",
+        YT_CLIENT_SECRET="bench",
+        YT_REFRESH_TOKEN="bench",
+        YT_API_ENDPOINT=yt.base_url,
+        YT_TOKEN_URI=f"{yt.base_url}token",
+        YT_CHUNK_SIZE_MB="1",
+        # a chunk that keeps failing ends the delivery; the outbox retry then resumes the saved session
+        YT_UPLOAD_RETRIES="1",
+        CONTENT_MODE="voxel_story",
+        SERIES_SEEDS=seeds,
+        TOPICS_PER_RUN=topics,
+        RENDER_ENGINE=engine,
+        PIPELINE_WORKERS=workers,
+        CACHE_DISABLE="0" if use_cache else "1",
+        CACHE_DIR=os.path.join(workdir, ".cache"),
+        STATE_DB=os.path.join(workdir, "state", "series.db"),
+        RUN_LOG=os.path.join(workdir, "logs", "run.jsonl"),
+        # injected publish failures are retried within the run instead of the next one
+        OUTBOX_RETRY_BASE="0.1",
+    ):
+        os.chdir(workdir)
+        try:
+            from . import main as pipeline, ratelimit, trace
+            from .ffmpeg import probe_duration
+
+            start = time.perf_counter()
+            try:
+                pipeline.main([])
+            finally:
+                wall = time.perf_counter() - start
+
+            out_files = [os.path.join("out", f) for f in os.listdir("out")]
+            videos = [f for f in out_files if f.endswith(".mp4")]
+            frames = sum(round(probe_duration(v) * 30) for v in videos)
+            stages = _stage_summary(trace.records())
+            render_s = stages.get("render", {}).get("total_s", 0)
+            return {
+                "config": {
+                    "topics": topics, "engine": engine, "workers": workers, "cache": use_cache,
+                    "latency": latency or {}, "fail_rate": fail_rate or {}, "seed": seed,
+                    "cpu_count": os.cpu_count(), "python": sys.version.split()[0],
+                },
+                "wall_time_s": round(wall, 3),
+                "videos": len(videos),
+                "stages": stages,
+                "cold_start": _cold_start(),
+                "render_fps": round(frames / render_s, 2) if render_s else None,
+                "peak_rss_mb": {"self": _rss_mb(resource.RUSAGE_SELF), "children": _rss_mb(resource.RUSAGE_CHILDREN)},
+                "output_bytes": sum(os.path.getsize(f) for f in out_files),
+                "openai_calls": dict(server.calls),
+                "bluesky_posts": len(pds.records),
+                "youtube": {
+                    "videos": len(yt.videos), "chunks": yt.chunks, "sessions": len(yt.sessions),
+                    "resumed": yt.status_queries, "expired": yt.expired,
+                    # every uploaded video must be byte-identical to a rendered one
+                    "intact": {_sha256(v) for v in yt.videos.values()} <= {_sha256_file(f) for f in videos},
+                },
+                "ratelimit": ratelimit.stats(),
+            }
+        finally:
+            os.chdir(cwd)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline Moneybot Shorts benchmark")
+    parser.add_argument("--topics", type=int, default=3)
+    parser.add_argument("--latency", default="", help="seconds, e.g. 0.2 or image=2,chat=0.5")
+    parser.add_argument("--fail-rate", default="", help="0..1, e.g. 0.1 or youtube=0.5")
+    parser.add_argument("--engine", default=os.environ.get("RENDER_ENGINE", "ffmpeg"), choices=("ffmpeg", "moviepy"))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("PIPELINE_WORKERS", "1")))
+    parser.add_argument("--cache", action="store_true", help="keep the OpenAI response cache enabled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=os.path.join("logs", "bench_output.json"))
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(
+        topics=args.topics,
+        latency=_per_endpoint(args.latency),
+        fail_rate=_per_endpoint(args.fail_rate),
+        engine=args.engine,
+        workers=args.workers,
+        use_cache=args.cache,
+        seed=args.seed,
+    )
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
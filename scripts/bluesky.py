@@ -5,14 +5,56 @@ bluesky.py
 This module handles posting content to Bluesky. Posting only occurs if the
 environment variables `BLUESKY_HANDLE` and `BLUESKY_APP_PASSWORD` are
 present. A thumbnail image can optionally be uploaded and attached to the
-post. Errors are logged but do not halt the main pipeline.
+post; it is re-encoded to fit Bluesky's blob limit first (`encode.py`).
+Errors are logged but do not halt the main pipeline.
+
+The logged-in client is shared across posts and its session is persisted, so
+most posts need no login at all (see `sessions.py`). `BLUESKY_SERVICE`
+points the client at another PDS, e.g. the local fake in `fakes.py`.
+
+Posts from the outbox carry a record key derived from the outbox entry
+(`record_key`), so every attempt of one delivery writes the same record. An
+attempt first looks that record up, and a create that fails (e.g. a 5xx
+after the PDS already stored the post) counts as delivered if the record is
+there, so a retry never produces a second post.
 """
 
+import hashlib
 import os
-from atproto import Client
+from typing import Optional
+
+from . import ratelimit
+from .sessions import bluesky_client
+
+
+# base32-sortable alphabet of atproto TIDs
+_TID_CHARS = "234567abcdefghijklmnopqrstuvwxyz"
+
+
+def record_key(key: str, created_at: float) -> str:
+    """
+    A TID (the record key type app.bsky.feed.post requires) that is stable for
+    `key`: the microsecond timestamp is `created_at`, the clock id a hash of `key`.
+    """
+    clock_id = int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:2], "big") & 0x3FF
+    n = (int(created_at * 1_000_000) << 10) | clock_id
+    return "".join(_TID_CHARS[(n >> (5 * i)) & 31] for i in range(12, -1, -1))
+
+
+def _existing_post(client, repo: str, rkey: str) -> Optional[str]:
+    """URI of the post stored under `rkey`, or None if there is none."""
+    from atproto import models
+    from atproto_client.exceptions import BadRequestError
+
+    params = models.ComAtprotoRepoGetRecord.Params(repo=repo, collection=models.ids.AppBskyFeedPost, rkey=rkey)
+    try:
+        return ratelimit.call("bluesky", None, lambda: client.com.atproto.repo.get_record(params)).uri
+    except BadRequestError:
+        # RecordNotFound
+        return None
 
 
-def post_bluesky(text: str, image_path: str = None, url: str = None) -> None:
+def post_bluesky(text: str, image_path: str = None, url: str = None, rkey: str = None) -> Optional[str]:
     """
     Post a message to Bluesky with an optional image and link.
 
@@ -21,35 +63,61 @@ def post_bluesky(text: str, image_path: str = None, url: str = None) -> None:
     text : str
         The main body of the post.
     image_path : str, optional
-        Path to an image file to upload. Must be JPEG.
+        Path to an image file to upload (any format Pillow reads).
     url : str, optional
         A URL to append to the post text.
+    rkey : str, optional
+        Record key for the post (see `record_key`); makes repeated calls idempotent.
+
+    Returns
+    -------
+    str or None
+        The URI of the created post, "skipped" if credentials are missing, or None on error.
     """
     handle = os.environ.get("BLUESKY_HANDLE")
     password = os.environ.get("BLUESKY_APP_PASSWORD")
     if not handle or not password:
         print("Bluesky credentials missing, skipping post")
-        return
-    client = Client()
+        return "skipped"
     try:
-        client.login(handle, password)
+        from atproto import models
+
+        client = bluesky_client(handle, password)
+        repo = client.me.did
+        existing = rkey and _existing_post(client, repo, rkey)
+        if existing:
+            print(f"Bluesky post {rkey} already exists, not posting again")
+            return existing
         full_text = text.strip()
         if url:
             full_text = f"{full_text} {url.strip()}"
         embed = None
         if image_path and os.path.isfile(image_path):
-            with open(image_path, "rb") as f:
-                upload_resp = client.com.atproto.repo.upload_blob(f, "image/jpeg")
-            embed = {"images": [{"image": upload_resp.blob, "alt": "thumbnail"}]}
-        client.com.atproto.repo.create_record(
-            repo=client.did,
-            collection="app.bsky.feed.post",
-            record={
-                "$type": "app.bsky.feed.post",
-                "text": full_text,
-                "createdAt": client.com.atproto.repo.get_current_time(),
-                "embed": embed,
-            },
+            from .encode import encode_bytes
+            # the PDS sniffs the mime type from the bytes
+            blob, _ = encode_bytes(image_path, "bluesky")
+            upload_resp = ratelimit.call("bluesky", None, lambda: client.com.atproto.repo.upload_blob(blob))
+            embed = models.AppBskyEmbedImages.Main(
+                images=[models.AppBskyEmbedImages.Image(image=upload_resp.blob, alt="thumbnail")]
+            )
+        record = models.AppBskyFeedPost.Record(
+            text=full_text,
+            created_at=client.get_current_time_iso(),
+            embed=embed,
+        )
+        data = models.ComAtprotoRepoCreateRecord.Data(
+            repo=repo, collection=models.ids.AppBskyFeedPost, record=record, rkey=rkey,
         )
+        # a post may already exist after a 5xx, so only a rejected (429) request is repeated
+        try:
+            resp = ratelimit.call("bluesky", None, lambda: client.com.atproto.repo.create_record(data),
+                                  statuses=(429,))
+        except Exception:
+            existing = rkey and _existing_post(client, repo, rkey)
+            if existing:
+                return existing
+            raise
+        return resp.uri
     except Exception as e:
         print(f"Bluesky error: {e}")
+        return None
@@ -0,0 +1,156 @@
+"""
+cache.py
+--------
+
+Persistent, content-addressed on-disk cache for OpenAI responses (chat scripts,
+images and speech). Entries are keyed by a SHA-256 over everything that
+determines the response (model, prompt/input, voice, speed, size, ...), so a
+retry after a failed render or upload reuses the previous results instead of
+paying for them again.
+
+Environment variables
+---------------------
+CACHE_DISABLE       Set to 1 to bypass the cache entirely.
+CACHE_DIR           Cache location (default `.cache/openai`).
+CACHE_MAX_MB        Evict least recently used entries above this size (default 500).
+CACHE_MAX_AGE_DAYS  Evict entries not used for this many days (default 14).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Optional
+
+from .util import ensure_dir
+
+
+def _cache_dir() -> str:
+    return os.environ.get("CACHE_DIR", ".cache/openai")
+
+
+def cache_enabled() -> bool:
+    return os.environ.get("CACHE_DISABLE", "").strip().lower() not in ("1", "true", "yes")
+
+
+def cache_key(kind: str, **fields) -> str:
+    """Stable hash of the request fields that determine a response."""
+    payload = json.dumps({"kind": kind, **fields}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str, suffix: str) -> str:
+    return os.path.join(_cache_dir(), key[:2], f"{key}{suffix}")
+
+
+def get_path(key: str, suffix: str = "") -> Optional[str]:
+    """Return the path of a cached entry, or None on a miss."""
+    if not cache_enabled():
+        return None
+    path = _entry_path(key, suffix)
+    if not os.path.isfile(path):
+        return None
+    # Touch so eviction is least-recently-used rather than oldest-written
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return path
+
+
+def get(key: str, suffix: str = "") -> Optional[bytes]:
+    path = get_path(key, suffix)
+    if path is None:
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def put(key: str, data: bytes, suffix: str = "") -> Optional[str]:
+    """Store `data` atomically under `key` and return the entry path."""
+    if not cache_enabled():
+        return None
+    path = _entry_path(key, suffix)
+    ensure_dir(os.path.dirname(path))
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    evict()
+    return path
+
+
+def put_file(key: str, src: str, suffix: str = "") -> Optional[str]:
+    """Like `put`, but copies the file at `src` without reading it into memory."""
+    if not cache_enabled():
+        return None
+    path = _entry_path(key, suffix)
+    ensure_dir(os.path.dirname(path))
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    evict()
+    return path
+
+
+def cached(key: str, produce: Callable[[], bytes], suffix: str = "") -> bytes:
+    """Return the cached bytes for `key`, calling `produce` on a miss."""
+    data = get(key, suffix)
+    if data is not None:
+        return data
+    data = produce()
+    put(key, data, suffix)
+    return data
+
+
+def evict(max_bytes: Optional[int] = None, max_age: Optional[float] = None) -> int:
+    """
+    Drop entries older than `max_age` seconds, then the least recently used
+    entries until the cache fits in `max_bytes`. Returns the number removed.
+    """
+    root = _cache_dir()
+    if not os.path.isdir(root):
+        return 0
+    if max_bytes is None:
+        max_bytes = int(float(os.environ.get("CACHE_MAX_MB", "500")) * 1024 * 1024)
+    if max_age is None:
+        max_age = float(os.environ.get("CACHE_MAX_AGE_DAYS", "14")) * 86400
+
+    entries = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+    now = time.time()
+    removed = 0
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in sorted(entries):
+        if now - mtime <= max_age and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
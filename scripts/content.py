@@ -7,12 +7,17 @@ metadata for each video. It prompts the model to return a JSON structure with
 the following keys: `script`, `tweet`, `title`, `description` and
 `hashtags`. A lightweight parser is included to cope with cases where the
 response isn't valid JSON.
+
+With `CONTENT_BATCH_PARTS` > 1 the next K parts of a series are written in one
+structured-JSON chat completion, so consecutive parts build on each other. The
+extra parts are stored in the series state as prefetched scripts and served
+from there until they run out.
 """
 
+import json
 import os
-from openai import OpenAI
-
-client = OpenAI()
+from . import cache, ratelimit, state
+from .sessions import openai_client as _client
 
 def _cta():
     aff = os.environ.get("AFFILIATE_URL", "").strip()
@@ -44,22 +49,88 @@ def _user_prompt(mode: str, seed: str, part: int):
     # mixed fallback
     return f"Write a 28-30s micro-episode in English titled '{seed}', Part {part}. Hook + cliffhanger."
 
+MODEL = "gpt-4o-mini"
+TEMPERATURE = 0.8
+
+def _batch_prompt(mode: str, seed: str, first: int, last: int):
+    return (f"{_user_prompt(mode, seed, first)}\n\n"
+            f"Also write Parts {first + 1} to {last} of the same series. Each part continues where the "
+            "previous one left off and follows the same rules.\n"
+            'Return JSON only: {"parts": [{"part": <number>, "script": "<narration>"}, ...]} '
+            "with one entry per part, in order.")
+
+def _parse_parts(raw: str, first: int, last: int):
+    """Map part number -> script from a batch response, skipping anything malformed."""
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        # tolerate prose or code fences around the JSON object
+        start, end = raw.find("{"), raw.rfind("}")
+        if start < 0 or end <= start:
+            return {}
+        try:
+            data = json.loads(raw[start:end + 1])
+        except ValueError:
+            return {}
+    scripts = {}
+    for item in data.get("parts", []) if isinstance(data, dict) else []:
+        try:
+            n, text = int(item["part"]), str(item["script"]).strip()
+        except (KeyError, TypeError, ValueError):
+            continue
+        if first <= n <= last and text:
+            scripts[n] = text
+    return scripts
+
+def _chat(messages, **kwargs) -> str:
+    def _call() -> bytes:
+        # rough token estimate (prompt at ~4 chars/token plus a reply budget) for the TPM bucket
+        tokens = sum(len(m["content"]) for m in messages) / 4 + 800
+        resp = ratelimit.call("openai", MODEL, lambda: _client().chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            temperature=TEMPERATURE,
+            **kwargs,
+        ), tokens=tokens)
+        return resp.choices[0].message.content.strip().encode("utf-8")
+
+    key = cache.cache_key("chat", model=MODEL, messages=messages, temperature=TEMPERATURE, **kwargs)
+    return cache.cached(key, _call, ".txt").decode("utf-8")
+
+def _prefetch_batch(series_key: str, mode: str, seed: str, part: int, language: str):
+    """Generate the next parts of a series in one call and store them as prefetch."""
+    batch = int(os.environ.get("CONTENT_BATCH_PARTS", "1"))
+    series = state.get_series(series_key)
+    last = part + batch - 1
+    if series:
+        last = min(last, series["parts_per_series"])
+    if last <= part:
+        return None
+    messages = [
+        {"role": "system", "content": _system(language)},
+        {"role": "user", "content": _batch_prompt(mode, seed, part, last)},
+    ]
+    scripts = _parse_parts(_chat(messages, response_format={"type": "json_object"}), part, last)
+    if scripts:
+        state.store_prefetch(series_key, scripts)
+    return scripts.get(part)
+
 def generate_content(topic, language="en"):
     meta = topic.get("meta", {})
     mode = meta.get("mode", os.environ.get("CONTENT_MODE", "mixed")).lower()
     seed = meta.get("seed", topic.get("title"))
     part = int(meta.get("part", 1))
+    series_key = meta.get("series_key")
 
-    messages = [
-        {"role": "system", "content": _system(language)},
-        {"role": "user", "content": _user_prompt(mode, seed, part)},
-    ]
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages,
-        temperature=0.8,
-    )
-    script = resp.choices[0].message.content.strip()
+    script = None
+    if series_key:
+        script = state.get_prefetch(series_key, part) or _prefetch_batch(series_key, mode, seed, part, language)
+    if not script:
+        messages = [
+            {"role": "system", "content": _system(language)},
+            {"role": "user", "content": _user_prompt(mode, seed, part)},
+        ]
+        script = _chat(messages)
 
     title = f"{seed} — Part {part}"
     desc = f"{script}\n\n{_cta()}"
@@ -0,0 +1,252 @@
+"""
+daemon.py
+---------
+
+Long-running scheduler for self-hosted boxes (`python -m scripts.main --daemon`).
+Instead of a fresh process per cron tick, one process runs the pipeline on a
+schedule and keeps everything warm between runs: imported modules, fonts,
+the OpenAI client and the Bluesky/YouTube sessions (`sessions.py`), the
+render process pool, and the outbox dispatcher, which keeps delivering
+between runs.
+
+The schedule is either an interval (`--every 90m`, `DAEMON_INTERVAL`; the
+first run starts immediately) or a five-field cron expression in UTC
+(`--cron "7 6,12,18 * * *"`, `DAEMON_CRON`). Without either the daemon runs
+every 8 hours. Each run first resumes unfinished jobs, then produces new parts.
+Deliveries that ran out of attempts stay failed; `--resume` on the command
+line retries them.
+
+A small HTTP endpoint (`DAEMON_HEALTH_ADDR`, default `127.0.0.1:8787`) serves
+`GET /health` (200 while the scheduler and the outbox dispatcher are alive)
+and `GET /status` (last and next run, counts, outbox and dispatcher state) as
+JSON. SIGTERM/SIGINT finish the current run and exit.
+"""
+
+import json
+import os
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Set
+
+from . import outbox, trace
+from .util import process_context
+
+DEFAULT_INTERVAL = 8 * 3600
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_interval(value: str) -> float:
+    """'90' (seconds), '90s', '30m', '8h' or '1d' to seconds."""
+    value = value.strip().lower()
+    if value[-1:] in _UNITS:
+        return float(value[:-1]) * _UNITS[value[-1]]
+    return float(value)
+
+
+# -------- Cron --------
+
+def _cron_field(spec: str, lo: int, hi: int) -> Set[int]:
+    values = set()
+    for part in spec.split(","):
+        body, _, step = part.partition("/")
+        if body == "*":
+            start, end = lo, hi
+        elif "-" in body:
+            start, end = (int(x) for x in body.split("-", 1))
+        else:
+            start = end = int(body)
+            if step:
+                end = hi
+        if not (lo <= start <= end <= hi):
+            raise ValueError(f"cron field {spec!r} out of range {lo}-{hi}")
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return values
+
+
+class Cron:
+    """Five-field cron expression (minute hour day-of-month month day-of-week), UTC."""
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expr!r}")
+        self.expr = expr
+        self.minutes = _cron_field(fields[0], 0, 59)
+        self.hours = _cron_field(fields[1], 0, 23)
+        self.days = _cron_field(fields[2], 1, 31)
+        self.months = _cron_field(fields[3], 1, 12)
+        # 0 and 7 are both Sunday
+        self.weekdays = {d % 7 for d in _cron_field(fields[4], 0, 7)}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, dt: datetime) -> bool:
+        dom = dt.day in self.days
+        dow = (dt.isoweekday() % 7) in self.weekdays
+        if self._any_day or self._any_weekday:
+            return dom and dow
+        # cron semantics: when both are restricted either one may match
+        return dom or dow
+
+    def next_after(self, after: datetime) -> datetime:
+        dt = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after + timedelta(days=366 * 5)
+        while dt <= limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f"cron expression never fires: {self.expr!r}")
+
+
+# -------- Health endpoint --------
+
+class _Status:
+    def __init__(self, schedule: str):
+        self._lock = threading.Lock()
+        self.data: Dict = {
+            "schedule": schedule, "started_at": time.time(), "state": "idle",
+            "runs": 0, "produced": 0, "failures": 0,
+            "last_run_at": None, "last_duration_s": None, "last_error": None, "next_run_at": None,
+        }
+
+    def update(self, **fields) -> None:
+        with self._lock:
+            self.data.update(fields)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.data)
+
+
+def _health_server(status: _Status, alive: threading.Thread,
+                   dispatcher: outbox.Dispatcher) -> Optional[ThreadingHTTPServer]:
+    addr = os.environ.get("DAEMON_HEALTH_ADDR", "127.0.0.1:8787")
+    if not addr or addr == "0":
+        return None
+    host, _, port = addr.rpartition(":")
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/health":
+                checks = {"scheduler": alive.is_alive(), "dispatcher": dispatcher.alive()}
+                ok = all(checks.values())
+                code, payload = (200 if ok else 503), {"ok": ok, **checks}
+            elif path == "/status":
+                code, payload = 200, {
+                    **status.snapshot(), "outbox": outbox.counts(),
+                    "dispatcher": {"alive": dispatcher.alive(), "last_error": dispatcher.error},
+                }
+            else:
+                code, payload = 404, {"error": "not found"}
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="daemon-health", daemon=True).start()
+    print(f"Health endpoint on http://{host or '127.0.0.1'}:{server.server_address[1]}/health")
+    return server
+
+
+# -------- Scheduler --------
+
+def _warm_worker(renders: int = 1) -> None:
+    # render workers import the render stack and parse the subtitle font once, up front
+    from . import render, video
+    from .subtitles import get_font
+
+    render.share_cores(renders)
+    get_font(video.SUBTITLE_STYLE.font_size)
+
+
+def _run_once(status: _Status, render_pool) -> None:
+    from . import main
+
+    trace.reset()
+    start = time.time()
+    status.update(state="running", last_run_at=start)
+    error = None
+    produced = 0
+    try:
+        produced = main.run(resume=True, render_pool=render_pool) or 0
+        produced += main.run(resume=False, render_pool=render_pool) or 0
+        print(trace.summary_table())
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        traceback.print_exception(e)
+    snap = status.snapshot()
+    status.update(
+        state="idle", runs=snap["runs"] + 1, produced=snap["produced"] + produced,
+        failures=snap["failures"] + (1 if error else 0),
+        last_duration_s=round(time.time() - start, 3), last_error=error,
+    )
+
+
+def serve(every: str = None, cron: str = None) -> None:
+    """Run the pipeline on a schedule until SIGTERM/SIGINT."""
+    from . import main
+
+    schedule = Cron(cron) if cron else None
+    interval = parse_interval(every) if every else DEFAULT_INTERVAL
+    status = _Status(f"cron {cron}" if cron else f"every {interval:g}s")
+    stop = threading.Event()
+
+    def _stop(signum, frame):
+        print("Stopping after the current run")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    workers = int(os.environ.get("PIPELINE_WORKERS", "1"))
+    _warm_worker()
+    with ExitStack() as stack:
+        # sequential runs render in this (already warm) process
+        render_pool = None
+        if workers > 1:
+            renders = main.render_workers(workers)
+            render_pool = stack.enter_context(
+                ProcessPoolExecutor(max_workers=renders, initializer=_warm_worker, initargs=(renders,),
+                                    mp_context=process_context())
+            )
+        dispatcher = stack.enter_context(outbox.Dispatcher(main.PUBLISH_TARGETS))
+        server = _health_server(status, threading.current_thread(), dispatcher)
+        try:
+            next_run = time.time() if schedule is None else schedule.next_after(datetime.now(timezone.utc)).timestamp()
+            while not stop.is_set():
+                status.update(next_run_at=next_run)
+                if stop.wait(max(0.0, next_run - time.time())):
+                    break
+                _run_once(status, render_pool)
+                if not dispatcher.alive():
+                    print(f"Outbox dispatcher is not running (last error: {dispatcher.error}); "
+                          "nothing is published until the daemon is restarted")
+                if schedule is None:
+                    next_run = max(next_run + interval, time.time())
+                else:
+                    next_run = schedule.next_after(datetime.now(timezone.utc)).timestamp()
+        finally:
+            if server:
+                server.shutdown()
+                server.server_close()
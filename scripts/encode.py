@@ -0,0 +1,137 @@
+"""
+encode.py
+---------
+
+Size-targeted image encoding for the places an image ends up: the thumbnail
+kept in `out/` (and in the artifact store), the Bluesky post embed and a
+YouTube thumbnail. Each target has a byte budget, a bounding box and a
+format:
+
+    data, mime = encode.encode_bytes("out/x_thumb.jpg", "bluesky")
+
+The image is scaled down to fit the box, then the highest quality that fits
+the budget is found by bisection in at most `ENCODE_MAX_STEPS` encodes; if
+even the lowest quality is too large the image is scaled down further.
+JPEGs are progressive and optimized, and no EXIF, ICC or other metadata is
+written.
+
+Environment variables
+---------------------
+IMAGE_TARGETS     Overrides per target, e.g. `bluesky=jpeg:950:2000x2000,archive=webp:150:1080x1920`
+                  (format, budget in KB, bounding box).
+ENCODE_MAX_STEPS  Encodes per size when searching for the quality (default 7).
+"""
+
+import io
+import os
+from typing import Dict, NamedTuple, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+
+class Target(NamedTuple):
+    format: str  # "jpeg" or "webp"
+    max_bytes: int
+    box: Tuple[int, int]
+    min_quality: int = 35
+    max_quality: int = 92
+
+
+# Bluesky rejects blobs over 1,000,000 bytes; YouTube thumbnails may be 2 MB
+DEFAULT_TARGETS: Dict[str, Target] = {
+    "archive": Target("jpeg", 250_000, (1080, 1920)),
+    "bluesky": Target("jpeg", 950_000, (2000, 2000)),
+    "youtube": Target("jpeg", 2_000_000, (1280, 1280)),
+}
+MIME = {"jpeg": "image/jpeg", "webp": "image/webp"}
+EXTENSIONS = {"jpeg": ".jpg", "webp": ".webp"}
+# shrink factor per round when the lowest quality still exceeds the budget
+_SHRINK = 0.8
+_MAX_SHRINKS = 4
+
+
+def target(name: str) -> Target:
+    base = DEFAULT_TARGETS[name]
+    for item in os.environ.get("IMAGE_TARGETS", "").split(","):
+        key, _, value = item.partition("=")
+        if key.strip() != name or not value:
+            continue
+        fmt, kb, box = (value.strip().split(":") + ["", ""])[:3]
+        w, _, h = box.partition("x")
+        base = base._replace(
+            format=fmt or base.format,
+            max_bytes=int(float(kb) * 1000) if kb else base.max_bytes,
+            box=(int(w), int(h)) if box else base.box,
+        )
+    return base
+
+
+def extension(name: str) -> str:
+    return EXTENSIONS[target(name).format]
+
+
+def _save(img: Image.Image, t: Target, quality: int) -> bytes:
+    buf = io.BytesIO()
+    if t.format == "webp":
+        img.save(buf, "WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def _search(img: Image.Image, t: Target, steps: int):
+    """Highest quality that fits `t.max_bytes` (None if none does) and the smallest oversize encoding."""
+    data = _save(img, t, t.max_quality)
+    if len(data) <= t.max_bytes:
+        return data, None
+    best, smallest = None, data
+    lo, hi = t.min_quality, t.max_quality - 1
+    for _ in range(steps - 1):
+        if lo > hi:
+            break
+        q = (lo + hi + 1) // 2
+        data = _save(img, t, q)
+        if len(data) <= t.max_bytes:
+            best, lo = data, q + 1
+        else:
+            smallest, hi = min(smallest, data, key=len), q - 1
+    return best, smallest
+
+
+def encode_bytes(source: Union[str, Image.Image, np.ndarray], name: str):
+    """Encode `source` for target `name`; returns `(data, mime type)`."""
+    t = target(name)
+    if isinstance(source, np.ndarray):
+        img = Image.fromarray(source)
+    elif isinstance(source, Image.Image):
+        img = source
+    else:
+        with Image.open(source) as f:
+            # JPEG draft mode decodes straight at a reduced size when the box allows it
+            f.draft("RGB", t.box)
+            img = f.convert("RGB")
+    # a fresh RGB copy: drops alpha and any metadata attached to the source
+    img = img.convert("RGB")
+    if img.width > t.box[0] or img.height > t.box[1]:
+        img.thumbnail(t.box, Image.LANCZOS)
+    steps = int(os.environ.get("ENCODE_MAX_STEPS", "7"))
+    for _ in range(_MAX_SHRINKS + 1):
+        data, smallest = _search(img, t, steps)
+        if data is not None:
+            break
+        img = img.resize((max(1, round(img.width * _SHRINK)), max(1, round(img.height * _SHRINK))), Image.LANCZOS)
+    else:
+        # still over budget after every shrink: send the smallest attempt rather than nothing
+        data = smallest
+    return data, MIME[t.format]
+
+
+def encode_file(source: Union[str, Image.Image, np.ndarray], name: str, out_path: str) -> str:
+    """Write `source` encoded for target `name` to `out_path` (atomically) and return it."""
+    data, _ = encode_bytes(source, name)
+    tmp = f"{out_path}.tmp.{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, out_path)
+    return out_path
@@ -0,0 +1,410 @@
+"""
+fakes.py
+--------
+
+Local stand-ins for the external services, used by the benchmark harness
+(`bench.py`) to run the whole pipeline offline.
+
+* `FakeOpenAI` is a small HTTP server speaking the subset of the OpenAI REST
+  API the pipeline uses (chat completions, image generation, speech). Point
+  the SDK at it with `OPENAI_BASE_URL`. Responses are deterministic: scripts
+  and images are derived from a hash of the prompt, speech is a quiet tone
+  whose length follows the number of words.
+* `FakeYouTube` serves the OAuth token endpoint and the resumable upload
+  protocol (session start, chunked PUTs, status queries), for exercising
+  `youtube_uploader` via `YT_API_ENDPOINT` / `YT_TOKEN_URI`. Failed session
+  starts use the `youtube` fault, failed chunks `youtube_chunk`, and
+  `youtube_expire` drops every open session (the next chunk gets a 404).
+* `FakeBluesky` is a minimal PDS (login, blob upload, createRecord,
+  getRecord) for running the real `post_bluesky` via `BLUESKY_SERVICE`.
+  Failed posts use the `bluesky` fault; `bluesky_lost` stores the post but
+  answers 502, like a response lost after the write.
+
+Every fake takes a `Faults` object with per-endpoint latency and a failure
+rate; failures come from a seeded RNG so runs are reproducible. For the
+OpenAI endpoints `<endpoint>_throttle` (e.g. `chat_throttle`) injects 429
+responses with a `Retry-After` header instead of 500s.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import math
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.parse
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+import numpy as np
+from PIL import Image
+
+
+class Faults:
+    """Per-endpoint latency (seconds) and failure rate (0..1)."""
+
+    def __init__(self, latency: Dict[str, float] = None, fail_rate: Dict[str, float] = None, seed: int = 0):
+        self.latency = latency or {}
+        self.fail_rate = fail_rate or {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def apply(self, endpoint: str) -> bool:
+        """Sleep for the endpoint latency; return True if this call should fail."""
+        delay = self.latency.get(endpoint, self.latency.get("*", 0.0))
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            return self._rng.random() < self.fail_rate.get(endpoint, self.fail_rate.get("*", 0.0))
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+_WORDS = ("the", "portal", "glowed", "and", "something", "moved", "below", "we", "ran", "faster",
+          "than", "ever", "but", "the", "door", "was", "already", "open")
+
+
+def fake_script(prompt: str, words: int = 60) -> str:
+    rng = random.Random(_digest(prompt))
+    sentences = []
+    while sum(len(s.split()) for s in sentences) < words:
+        n = rng.randint(5, 10)
+        sentences.append(" ".join(rng.choice(_WORDS) for _ in range(n)).capitalize() + rng.choice(".!?"))
+    return " ".join(sentences)
+
+
+def fake_image(prompt: str, size=(1024, 1536)) -> bytes:
+    """Deterministic smooth-noise JPEG, so resampling costs resemble a real image."""
+    w, h = size
+    rng = np.random.default_rng(_digest(prompt))
+    img = np.zeros((h, w, 3), dtype=np.float32)
+    for k in (8, 32, 128):
+        noise = (rng.random((h // k + 2, w // k + 2, 3)) * 255).astype(np.uint8)
+        img += np.asarray(Image.fromarray(noise).resize((w, h), Image.BICUBIC), dtype=np.float32) / 3
+    buf = io.BytesIO()
+    Image.fromarray(img.clip(0, 255).astype(np.uint8)).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def fake_speech(text: str, seconds_per_word: float = 0.35, rate: int = 24000) -> bytes:
+    """16-bit mono WAV tone with a duration proportional to the word count."""
+    duration = max(1.0, len(text.split()) * seconds_per_word)
+    n = int(duration * rate)
+    t = np.arange(n) / rate
+    samples = (np.sin(2 * math.pi * 220 * t) * 3000).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+
+def encode_speech(wav: bytes, fmt: str) -> bytes:
+    """Transcode fake WAV speech to the requested `response_format` (aac, opus, mp3, pcm)."""
+    if fmt in (None, "wav"):
+        return wav
+    if fmt == "pcm":
+        with wave.open(io.BytesIO(wav), "rb") as w:
+            return w.readframes(w.getnframes())
+    from .ffmpeg import ffmpeg_exe
+
+    muxer, codec = {"aac": ("adts", "aac"), "opus": ("ogg", "libopus"), "mp3": ("mp3", "libmp3lame")}[fmt]
+    proc = subprocess.run(
+        [ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-f", "wav", "-i", "-",
+         "-c:a", codec, "-f", muxer, "-"],
+        input=wav, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+    )
+    return proc.stdout
+
+
+_PARTS_RE = re.compile(r"Parts (\d+) to (\d+)")
+_PART_RE = re.compile(r"Part (\d+)")
+
+
+def _chat_reply(body: dict) -> str:
+    prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        first = int(_PART_RE.search(prompt).group(1)) if _PART_RE.search(prompt) else 1
+        m = _PARTS_RE.search(prompt)
+        last = int(m.group(2)) if m else first
+        return json.dumps({"parts": [
+            {"part": p, "script": fake_script(f"{prompt}#{p}")} for p in range(first, last + 1)
+        ]})
+    return fake_script(prompt)
+
+
+class FakeOpenAI:
+    """Threaded local OpenAI API stand-in; use as a context manager."""
+
+    def __init__(self, faults: Faults = None, host: str = "127.0.0.1", port: int = 0):
+        self.faults = faults or Faults()
+        self.calls: Dict[str, int] = {}
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload: bytes, ctype="application/json", headers=None):
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                endpoint = {
+                    "/v1/chat/completions": "chat",
+                    "/v1/images/generations": "image",
+                    "/v1/audio/speech": "speech",
+                }.get(self.path.split("?")[0])
+                if endpoint is None:
+                    return self._send(404, b'{"error": {"message": "not found"}}')
+                fake.calls[endpoint] = fake.calls.get(endpoint, 0) + 1
+                if fake.faults.apply(f"{endpoint}_throttle"):
+                    return self._send(429, b'{"error": {"message": "injected rate limit", "type": "rate_limit"}}',
+                                      headers={"Retry-After": "1"})
+                if fake.faults.apply(endpoint):
+                    return self._send(500, b'{"error": {"message": "injected failure", "type": "server_error"}}')
+                if endpoint == "chat":
+                    reply = {
+                        "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                        "model": body.get("model", ""),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": _chat_reply(body)}}],
+                    }
+                    return self._send(200, json.dumps(reply).encode())
+                if endpoint == "image":
+                    b64 = base64.b64encode(fake_image(body.get("prompt", ""))).decode()
+                    reply = {"created": int(time.time()), "data": [{"b64_json": b64}]}
+                    return self._send(200, json.dumps(reply).encode())
+                fmt = body.get("response_format") or "mp3"
+                return self._send(200, encode_speech(fake_speech(body.get("input", "")), fmt), f"audio/{fmt}")
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
+
+
+class FakeYouTube:
+    """Local YouTube resumable upload endpoint; use as a context manager."""
+
+    def __init__(self, faults: Faults = None, host: str = "127.0.0.1", port: int = 0):
+        self.faults = faults or Faults()
+        # session id -> {"data": bytearray, "total": int, "meta": dict}
+        self.sessions: Dict[str, Dict] = {}
+        self.chunks = 0
+        self.status_queries = 0
+        self.expired = 0
+        self.token_requests = 0
+        self.videos: Dict[str, bytes] = {}
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload: bytes = b"", headers=None):
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def do_POST(self):
+                body = self._body()
+                path = self.path.split("?")[0]
+                if path == "/token":
+                    fake.token_requests += 1
+                    return self._send(200, b'{"access_token": "fake", "expires_in": 3600, "token_type": "Bearer"}')
+                if path != "/upload/youtube/v3/videos":
+                    return self._send(404)
+                if fake.faults.apply("youtube"):
+                    return self._send(503, b'{"error": {"message": "injected failure"}}')
+                sid = hashlib.sha256(body + str(time.time()).encode()).hexdigest()[:16]
+                fake.sessions[sid] = {
+                    "data": bytearray(),
+                    "total": int(self.headers.get("X-Upload-Content-Length") or 0),
+                    "meta": json.loads(body or b"{}"),
+                }
+                host, port = fake.server.server_address[:2]
+                self._send(200, headers={"Location": f"http://{host}:{port}/upload/session/{sid}"})
+
+            def do_PUT(self):
+                data = self._body()
+                session = fake.sessions.get(self.path.rsplit("/", 1)[-1])
+                if session is None:
+                    return self._send(404, b'{"error": {"message": "session expired"}}')
+                received = len(session["data"])
+                content_range = self.headers.get("Content-Range", "")
+                if content_range.startswith("bytes */"):
+                    fake.status_queries += 1
+                else:
+                    fake.chunks += 1
+                    if fake.faults.apply("youtube_expire"):
+                        fake.expire_sessions()
+                        return self._send(404, b'{"error": {"message": "session expired"}}')
+                    if fake.faults.apply("youtube_chunk"):
+                        return self._send(503, b'{"error": {"message": "injected failure"}}')
+                    start = int(content_range.split()[1].split("-")[0])
+                    if start != received:
+                        return self._send(400, b'{"error": {"message": "bad offset"}}')
+                    session["data"] += data
+                    received = len(session["data"])
+                if received >= session["total"]:
+                    vid = f"fake{len(fake.videos):08d}"
+                    fake.videos[vid] = bytes(session["data"])
+                    return self._send(200, json.dumps({"id": vid, "snippet": session["meta"].get("snippet")}).encode())
+                headers = {"Range": f"bytes=0-{received - 1}"} if received else {}
+                self._send(308, headers=headers)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def expire_sessions(self) -> None:
+        """Forget every open upload session, as YouTube does after about a week."""
+        self.expired += len(self.sessions)
+        self.sessions.clear()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
+
+
+def _fake_jwt(sub: str, lifetime: int = 7200) -> str:
+    def part(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=").decode()
+    now = int(time.time())
+    return f"{part({'alg': 'HS256', 'typ': 'JWT'})}.{part({'sub': sub, 'iat': now, 'exp': now + lifetime})}.fake"
+
+
+class FakeBluesky:
+    """Local Bluesky PDS (the XRPC calls `bluesky.py` makes); use as a context manager."""
+
+    DID = "did:plc:fake"
+
+    def __init__(self, faults: Faults = None, host: str = "127.0.0.1", port: int = 0):
+        self.faults = faults or Faults()
+        # (collection, rkey) -> record
+        self.records: Dict[tuple, Dict] = {}
+        self.blobs = 0
+        self.logins = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, obj):
+                payload = json.dumps(obj).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _session(self):
+                return {"did": fake.DID, "handle": "bench.fake", "accessJwt": _fake_jwt(fake.DID),
+                        "refreshJwt": _fake_jwt(fake.DID, 86400)}
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                query = dict(urllib.parse.parse_qsl(url.query))
+                if url.path == "/xrpc/app.bsky.actor.getProfile":
+                    return self._send(200, {"did": fake.DID, "handle": "bench.fake"})
+                if url.path == "/xrpc/com.atproto.repo.getRecord":
+                    record = fake.records.get((query.get("collection"), query.get("rkey")))
+                    if record is None:
+                        return self._send(400, {"error": "RecordNotFound", "message": "Could not locate record"})
+                    return self._send(200, record)
+                self._send(404, {"error": "MethodNotImplemented"})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                path = urllib.parse.urlsplit(self.path).path
+                if path in ("/xrpc/com.atproto.server.createSession", "/xrpc/com.atproto.server.refreshSession"):
+                    fake.logins += 1
+                    return self._send(200, self._session())
+                if path == "/xrpc/com.atproto.repo.uploadBlob":
+                    fake.blobs += 1
+                    cid = f"bafkrei{hashlib.sha256(body).hexdigest()[:52]}"
+                    return self._send(200, {"blob": {"$type": "blob", "ref": {"$link": cid},
+                                                     "mimeType": "image/jpeg", "size": len(body)}})
+                if path != "/xrpc/com.atproto.repo.createRecord":
+                    return self._send(404, {"error": "MethodNotImplemented"})
+                if fake.faults.apply("bluesky"):
+                    return self._send(500, {"error": "InternalServerError", "message": "injected failure"})
+                data = json.loads(body)
+                collection = data["collection"]
+                with fake._lock:
+                    rkey = data.get("rkey") or f"{len(fake.records):013d}"
+                    if (collection, rkey) in fake.records:
+                        return self._send(400, {"error": "InvalidRequest", "message": "Record already exists"})
+                    uri = f"at://{fake.DID}/{collection}/{rkey}"
+                    cid = f"bafyrei{hashlib.sha256(body).hexdigest()[:52]}"
+                    fake.records[(collection, rkey)] = {"uri": uri, "cid": cid, "value": data["record"]}
+                if fake.faults.apply("bluesky_lost"):
+                    return self._send(502, {"error": "UpstreamFailure", "message": "injected lost response"})
+                self._send(200, {"uri": uri, "cid": cid})
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/xrpc"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
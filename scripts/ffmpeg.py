@@ -0,0 +1,56 @@
+"""
+ffmpeg.py
+---------
+
+Small helpers for driving the ffmpeg binary directly: locating the executable
+(`FFMPEG_BINARY`, then `PATH`, then the copy bundled with imageio-ffmpeg that
+MoviePy already depends on), probing media durations and running commands.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+from functools import lru_cache
+from typing import List
+
+
+@lru_cache(maxsize=1)
+def ffmpeg_exe() -> str:
+    exe = os.environ.get("FFMPEG_BINARY") or shutil.which("ffmpeg")
+    if exe:
+        return exe
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception as e:
+        raise FileNotFoundError("ffmpeg binary not found (set FFMPEG_BINARY)") from e
+
+
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+def probe_duration(path: str) -> float:
+    """Return the container duration of `path` in seconds."""
+    # `ffmpeg -i` without an output exits non-zero but prints the header info
+    proc = subprocess.run(
+        [ffmpeg_exe(), "-hide_banner", "-i", path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    m = _DURATION_RE.search(proc.stderr.decode("utf-8", "replace"))
+    if not m:
+        raise RuntimeError(f"could not read duration of {path}")
+    h, mnt, sec = m.groups()
+    return int(h) * 3600 + int(mnt) * 60 + float(sec)
+
+
+def run_ffmpeg(args: List[str]) -> None:
+    """Run ffmpeg with `args`, raising with its stderr on failure."""
+    proc = subprocess.run(
+        [ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {proc.stderr.decode('utf-8', 'replace').strip()}")
@@ -5,13 +5,21 @@ images.py
 Generate vertical background images using OpenAI's DALL·E model. The function
 constructs an evocative prompt based on the topic title and downloads the
 returned image. Images are saved to the `out/` directory.
+
+Parts of a series share a small bank of backgrounds (`backgrounds.py`), so
+most parts need no image request at all.
+
+The base64 payload is decoded slice by slice straight into the file, so the
+decoded image is never held in memory next to the encoded string.
 """
 
+import base64
 import os
-from openai import OpenAI
-from .util import ensure_dir, safe_filename
+import shutil
 
-client = OpenAI()
+from . import backgrounds, cache, ratelimit
+from .sessions import openai_client as _client
+from .util import ensure_dir, safe_filename
 
 def _img_prompt(mode: str, seed: str, part: int):
     if mode == "voxel_story":
@@ -25,25 +33,50 @@ def _img_prompt(mode: str, seed: str, part: int):
                 f"fits theme '{seed}', Part {part}.")
     return "Vertical 1080x1920 cinematic illustration, dramatic, clean focal point."
 
+def _b64_to_file(b64: str, path: str, chunk: int = 1 << 20) -> None:
+    # chunk is a multiple of 4, so every slice decodes on its own
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "wb") as f:
+        for i in range(0, len(b64), chunk):
+            f.write(base64.b64decode(b64[i:i + chunk]))
+    os.replace(tmp, path)
+
+def topic_slug(topic) -> str:
+    """File slug for a topic's artifacts; depends only on the series meta."""
+    meta = topic.get("meta", {})
+    seed = meta.get("seed", topic.get("title"))
+    part = int(meta.get("part", 1))
+    return safe_filename(f"{seed}-part-{part}".lower())
+
+def _fetch_image(prompt: str, out_path: str, model: str = "gpt-image-1", size: str = "1080x1920") -> None:
+    key = cache.cache_key("image", model=model, prompt=prompt, size=size)
+    hit = cache.get_path(key, ".jpg")
+    if hit:
+        shutil.copyfile(hit, out_path)
+        return
+    img = ratelimit.call("openai", model, lambda: _client().images.generate(
+        model=model,
+        prompt=prompt,
+        size=size,
+    ))
+    _b64_to_file(img.data[0].b64_json, out_path)
+    del img
+    cache.put_file(key, out_path, ".jpg")
+
 def generate_image_for_topic(topic, out_dir="out"):
     meta = topic.get("meta", {})
     mode = meta.get("mode", os.environ.get("CONTENT_MODE", "mixed")).lower()
     seed = meta.get("seed", topic.get("title"))
     part = int(meta.get("part", 1))
 
-    prompt = _img_prompt(mode, seed, part)
     ensure_dir(out_dir)
 
-    slug = safe_filename(f"{seed}-part-{part}".lower())
+    slug = topic_slug(topic)
     out_path = os.path.join(out_dir, f"{slug}.jpg")
 
-    img = client.images.generate(
-        model="gpt-image-1",
-        prompt=prompt,
-        size="1080x1920",
-    )
-    b64 = img.data[0].b64_json
-    import base64
-    with open(out_path, "wb") as f:
-        f.write(base64.b64decode(b64))
+    # later parts of a series reuse the series' background bank (see backgrounds.py)
+    if backgrounds.pick(mode, seed, part, out_path):
+        return out_path, slug
+    _fetch_image(_img_prompt(mode, seed, part), out_path)
+    backgrounds.add(mode, seed, part, out_path)
     return out_path, slug
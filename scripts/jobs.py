@@ -0,0 +1,124 @@
+"""
+jobs.py
+-------
+
+Durable job manifest. Every topic becomes a job record in the state database
+with one entry per stage (script, image, audio, assets, render, thumbnail,
+bluesky, youtube). A stage records its status, artifact and attempt count, so an
+interrupted or partially failed job picks up at its first incomplete stage
+(`python -m scripts.main --resume`) and no expensive stage runs twice.
+
+Stage status is one of `pending`, `done`, `failed` or `skipped`.
+"""
+
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from . import state
+
+STAGES = ("script", "image", "audio", "assets", "render", "thumbnail", "bluesky", "youtube")
+# Stages whose artifact is a file on disk; the publish stages record a post/video id.
+# The assets stage is left out: its master is deleted after rendering and rebuilt on demand.
+FILE_STAGES = ("script", "image", "audio", "render", "thumbnail")
+
+_COMPLETE = ("done", "skipped")
+
+
+def job_id(topic) -> str:
+    meta = topic["meta"]
+    return f"{meta['series_key']}#{int(meta['part'])}"
+
+
+def _row_to_job(row) -> Dict:
+    job = dict(row)
+    job["topic"] = json.loads(job["topic"])
+    job["stages"] = json.loads(job["stages"])
+    job["advanced"] = bool(job["advanced"])
+    return job
+
+
+def _new_stage() -> Dict:
+    return {"status": "pending", "artifact": None, "attempts": 0}
+
+
+def open_job(topic) -> Dict:
+    """Return the job for `topic`, creating it with all stages pending."""
+    jid = job_id(topic)
+    now = time.time()
+    stages = {name: _new_stage() for name in STAGES}
+    with state.transaction() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO jobs (id, series_key, part, topic, stages, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (jid, topic["meta"]["series_key"], int(topic["meta"]["part"]),
+             json.dumps(topic, ensure_ascii=False), json.dumps(stages), now, now),
+        )
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (jid,)).fetchone()
+    return _row_to_job(row)
+
+
+def get_job(jid: str) -> Optional[Dict]:
+    row = state.connect().execute("SELECT * FROM jobs WHERE id = ?", (jid,)).fetchone()
+    return _row_to_job(row) if row else None
+
+
+def unfinished_jobs() -> List[Dict]:
+    rows = state.connect().execute(
+        "SELECT * FROM jobs WHERE status != 'done' ORDER BY created_at"
+    ).fetchall()
+    return [_row_to_job(r) for r in rows]
+
+
+def _update_stage(jid: str, name: str, **fields) -> Dict:
+    # read-modify-write inside one transaction; stages of a job run on several threads
+    with state.transaction() as conn:
+        row = conn.execute("SELECT stages FROM jobs WHERE id = ?", (jid,)).fetchone()
+        stages = json.loads(row["stages"])
+        # jobs created before a stage existed simply lack its entry
+        stages.setdefault(name, _new_stage()).update(fields)
+        status = "done" if all(s["status"] in _COMPLETE for s in stages.values()) else "pending"
+        if any(s["status"] == "failed" for s in stages.values()):
+            status = "failed"
+        conn.execute(
+            "UPDATE jobs SET stages = ?, status = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(stages), status, time.time(), jid),
+        )
+    return stages[name]
+
+
+def _is_complete(name: str, stage: Dict) -> bool:
+    if stage["status"] not in _COMPLETE:
+        return False
+    # a file artifact that has since disappeared means the stage must run again
+    artifact = stage.get("artifact")
+    return not (name in FILE_STAGES and artifact and not os.path.exists(artifact))
+
+
+def run_stage(jid: str, name: str, fn: Callable[[], Optional[str]]):
+    """
+    Run `fn` for stage `name` unless it already completed, and return the
+    stage artifact. Failures are recorded with their attempt count and re-raised.
+    """
+    stage = get_job(jid)["stages"].get(name) or _new_stage()
+    if _is_complete(name, stage):
+        return stage["artifact"]
+    attempts = stage["attempts"] + 1
+    try:
+        artifact = fn()
+    except Exception as e:
+        _update_stage(jid, name, status="failed", attempts=attempts, error=str(e))
+        raise
+    _update_stage(jid, name, status="done", artifact=artifact, attempts=attempts, error=None)
+    return artifact
+
+
+def skip_stage(jid: str, name: str) -> None:
+    if (get_job(jid)["stages"].get(name) or _new_stage())["status"] != "done":
+        _update_stage(jid, name, status="skipped")
+
+
+def mark_advanced(jid: str) -> None:
+    with state.transaction() as conn:
+        conn.execute("UPDATE jobs SET advanced = 1, updated_at = ? WHERE id = ?", (time.time(), jid))
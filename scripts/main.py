@@ -5,68 +5,371 @@ main.py
 Entry point for the Moneybot Shorts pipeline.
 Generates themed series videos (e.g. voxel stories, spooky stories, funny texts).
 Each run produces up to 3 new parts. Continues series state automatically.
+
+Set `PIPELINE_WORKERS` above 1 to process topics concurrently: the network-bound
+stages run on a thread pool and `create_video` runs in a process pool
+(`RENDER_WORKERS`, defaults to the number of pipeline workers capped at the CPU count).
+
+Each stage is traced (duration, retries, bytes, memory) to a JSON-lines run log
+under `logs/` and summarised at the end of the run (see `trace.py`).
+
+Publishing goes through a persistent outbox (see `outbox.py`): Bluesky and
+YouTube deliveries run in the background while the next topic is generated,
+and are retried on later runs if a target is down.
+
+Every topic is tracked as a job with per-stage checkpoints (see `jobs.py`).
+`python -m scripts.main --resume` picks up unfinished jobs at their first
+incomplete stage instead of producing new parts, and gives deliveries that
+ran out of attempts a fresh set.
+
+Finished file stages are filed in the content-addressed artifact store (see
+`artifacts.py`), and every run ends by applying its retention policy, so
+`out/` only holds the recent parts of each series.
 """
 
+import argparse
 import os
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
 
-from .trends import get_trends, advance_series
+from . import artifacts, jobs, outbox, ratelimit, state, trace
+from .trends import get_trends, advance_series, release_series
 from .content import generate_content
-from .images import generate_image_for_topic
+from .images import generate_image_for_topic, topic_slug
 from .tts import generate_tts
-from .video import create_video
-from .bluesky import post_bluesky
-from .youtube_uploader import upload_youtube
-from .util import slugify, timestamp, ensure_dir
+from .audio import timings_path
+from .util import read_json, write_json, ensure_dir, process_context
 
 
-def main():
-    language = os.environ.get("LANGUAGE", "en")
-    affiliate_url = os.environ.get("AFFILIATE_URL")
-    ensure_dir("out")
+# Rendering (NumPy, Pillow, MoviePy) and the upload clients are slow to import,
+# so they are loaded when their stage first runs rather than at startup.
 
-    topics = get_trends()
-    if not topics:
-        print("No topics found")
-        return
+def create_video(*args, **kwargs):
+    from .video import create_video
+    return create_video(*args, **kwargs)
+
+
+def prepare_assets(*args, **kwargs):
+    from .assets import prepare_assets
+    return prepare_assets(*args, **kwargs)
+
+
+def extract_thumbnail(*args, **kwargs):
+    from .video import extract_thumbnail
+    return extract_thumbnail(*args, **kwargs)
+
+
+def post_bluesky(*args, **kwargs):
+    from .bluesky import post_bluesky
+    return post_bluesky(*args, **kwargs)
+
+
+def upload_youtube(*args, **kwargs):
+    from .youtube_uploader import upload_youtube
+    return upload_youtube(*args, **kwargs)
+
+
+def _stage(jid, name, fn, inputs=(), sidecars=None):
+    """
+    Run a job stage inside a trace span. The outputs of a file stage (its
+    artifact plus the role -> path map `sidecars(artifact)` returns) are
+    recorded in the artifact store.
+    """
+    def produce():
+        # writers overwrite in place; never let them write through a link into the store
+        artifacts.detach(jid, name)
+        artifact = fn()
+        if name in jobs.FILE_STAGES and artifact:
+            artifacts.record(jid, name, {name: artifact, **(sidecars(artifact) if sidecars else {})})
+        return artifact
+
+    # a runner that kept only state/ gets the job's files back before they are checked
+    artifacts.restore(jid)
+    with trace.span(name, inputs=inputs, job=jid) as sp:
+        artifact = jobs.run_stage(jid, name, produce)
+        sp.output(artifact)
+        return artifact
+
+
+def _preview(video_path):
+    from .render import preview_path
+    return {"preview": preview_path(video_path)}
+
+
+def _checked(name, fn):
+    """A publish call that returns None has failed; turn that into an exception."""
+    def run():
+        result = fn()
+        if result is None:
+            raise RuntimeError(f"{name} publish failed")
+        return result if isinstance(result, str) else result.get("id")
+    return run
+
+
+def _deliver_bluesky(entry):
+    from .bluesky import record_key
+
+    artifacts.restore(entry["job_id"])
+    p = entry["payload"]
+    # the same record key on every attempt, so a retry after a lost response cannot post twice
+    rkey = record_key(entry["id"], entry["created_at"])
+    publish = _checked("bluesky", lambda: post_bluesky(p["text"], p["image"], p["url"], rkey=rkey))
+    return _stage(entry["job_id"], "bluesky", publish, inputs=(p["image"],))
+
+
+def _deliver_youtube(entry):
+    artifacts.restore(entry["job_id"])
+    p = entry["payload"]
+    publish = _checked("youtube", lambda: upload_youtube(p["video"], p["title"], p["description"], p["tags"]))
+    return _stage(entry["job_id"], "youtube", publish, inputs=(p["video"],))
+
+
+PUBLISH_TARGETS = {"bluesky": _deliver_bluesky, "youtube": _deliver_youtube}
+
+
+def _process_topic(topic, language, affiliate_url, render=create_video, out_dir="out"):
+    """
+    Run every stage for one topic and return its job id once the video is
+    rendered and queued for publishing.
+
+    The image prompt only depends on the series meta, so the image request is
+    started alongside the chat call; TTS starts as soon as the script is ready
+    and rendering waits for both. Stages already completed by an earlier run
+    are skipped.
+    """
+    print(f"Processing topic: {topic['title']}")
+    jid = jobs.open_job(topic)["id"]
+    slug = topic_slug(topic)
+
+    def _script():
+        path = os.path.join(out_dir, f"{slug}.content.json")
+        write_json(path, generate_content(topic, language=language))
+        return path
+
+    with ThreadPoolExecutor(max_workers=2) as stages:
+        # Generate background image (independent of the script)
+        image_future = stages.submit(
+            _stage, jid, "image", lambda: generate_image_for_topic(topic, out_dir)[0]
+        )
+        # Generate narrative content and metadata
+        content = read_json(_stage(jid, "script", _script), {})
+        script = content.get("script", "")
+        tweet = content.get("tweet", "")
+        title = content.get("title", topic['title'])
+        description = content.get("description", "")
+        hashtags = content.get("hashtags", [])
+
+        # Generate voice over audio while the image is still in flight
+        audio_path = _stage(jid, "audio", lambda: generate_tts(script, slug, out_dir),
+                            sidecars=lambda path: {"timings": timings_path(path)})
+        img_path = image_future.result()
+
+    # Decode and upscale the background once; every render process memory-maps it
+    bg_path = _stage(jid, "assets", lambda: prepare_assets(img_path, audio_path), inputs=(img_path,))
+
+    # Compose video and thumbnail
+    rendered = {}
 
+    def _render():
+        rendered["video"], rendered["thumb"] = render(img_path, audio_path, script, slug)
+        return rendered["video"]
+
+    video_path = _stage(jid, "render", _render, inputs=(img_path, audio_path), sidecars=_preview)
+    # the master is tens of MB and only needed while rendering
+    if bg_path and os.path.exists(bg_path):
+        os.remove(bg_path)
+    def _thumbnail():
+        if rendered.get("thumb"):
+            return rendered["thumb"]
+        from .encode import extension
+        return extract_thumbnail(video_path, os.path.join(out_dir, f"{slug}_thumb{extension('archive')}"))
+
+    thumb_path = _stage(jid, "thumbnail", _thumbnail)
+
+    # Hand the video to the publish outbox; delivery runs in the background
+    deliveries = {
+        "youtube": {
+            "video": video_path, "title": title,
+            "description": description + "\n\n" + (affiliate_url or ""), "tags": hashtags,
+        },
+    }
+    if tweet:
+        deliveries["bluesky"] = {"text": tweet, "image": thumb_path, "url": affiliate_url}
+    else:
+        jobs.skip_stage(jid, "bluesky")
+    outbox.enqueue(jid, deliveries)
+
+    return jid
+
+
+def _finish(topic, jid) -> bool:
+    """
+    Advance the series once per produced part, however many runs it took.
+    Returns True if the part was advanced now, i.e. counts as produced by this run.
+    """
+    if jobs.get_job(jid)["advanced"]:
+        return False
+    advance_series(topic["meta"]["series_key"])
+    jobs.mark_advanced(jid)
+    return True
+
+
+def _fail(topic, e):
+    print(f"Error processing topic {topic.get('title')}: {e}")
+    traceback.print_exception(e)
+    job = jobs.get_job(jobs.job_id(topic))
+    if not (job and job["advanced"]):
+        # let the next run retry this part
+        release_series(topic["meta"]["series_key"])
+
+
+def _run_sequential(topics, language, affiliate_url):
     produced = 0
     for topic in topics:
         try:
-            print(f"Processing topic: {topic['title']}")
-            # Generate narrative content and metadata
-            content = generate_content(topic, language=language)
-            script = content.get("script", "")
-            tweet = content.get("tweet", "")
-            title = content.get("title", topic['title'])
-            description = content.get("description", "")
-            hashtags = content.get("hashtags", [])
-            slug = slugify(title)
-
-            # Generate background image
-            img_path, slug = generate_image_for_topic(topic)
-            # Generate voice over audio
-            audio_path = generate_tts(script, slug)
-            # Compose video and thumbnail
-            video_path, thumb_path = create_video(img_path, audio_path, script, slug)
-
-            # Post to Bluesky if possible
-            if tweet:
-                post_bluesky(tweet, thumb_path, affiliate_url)
-            # Upload to YouTube (optional)
-            upload_youtube(video_path, title, description + "\n\n" + (affiliate_url or ""), hashtags)
-
-            # advance to next part in this series
-            series_key = topic["meta"]["series_key"]
-            advance_series(series_key)
-
-            produced += 1
+            jid = _process_topic(topic, language, affiliate_url)
+            produced += _finish(topic, jid)
         except Exception as e:
-            print(f"Error processing topic {topic.get('title')}: {e}")
-            traceback.print_exc()
+            _fail(topic, e)
+            continue
+    return produced
+
+
+def render_workers(workers: int) -> int:
+    return int(os.environ.get("RENDER_WORKERS", "0")) or min(workers, os.cpu_count() or 1)
+
+
+def _init_render_worker(renders: int) -> None:
+    from . import render
+
+    render.share_cores(renders)
+
+
+def _run_concurrent(topics, language, affiliate_url, workers, render_pool=None):
+    produced = 0
+    with ExitStack() as stack:
+        if render_pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            renders = render_workers(workers)
+            render_pool = stack.enter_context(
+                ProcessPoolExecutor(max_workers=renders, mp_context=process_context(),
+                                    initializer=_init_render_worker, initargs=(renders,))
+            )
+        pool = stack.enter_context(ThreadPoolExecutor(max_workers=workers))
+
+        def render(*args):
+            # MoviePy encodes are CPU-bound; keep them off the GIL
+            return render_pool.submit(create_video, *args).result()
+
+        futures = {
+            pool.submit(_process_topic, topic, language, affiliate_url, render): topic
+            for topic in topics
+        }
+        # advance_series is called once per successful topic
+        for future in as_completed(futures):
+            topic = futures[future]
+            try:
+                produced += _finish(topic, future.result())
+            except Exception as e:
+                _fail(topic, e)
+    return produced
+
+
+def _resumable_topics():
+    """
+    Topics of unfinished jobs; parts not yet advanced are claimed again first.
+    Advanced jobs only waiting for their deliveries are left to the outbox.
+    """
+    topics = []
+    for job in jobs.unfinished_jobs():
+        todo = {n for n, s in job["stages"].items() if s["status"] not in ("done", "skipped")}
+        if job["advanced"] and todo <= set(PUBLISH_TARGETS):
             continue
+        if job["advanced"] or state.claim_next_part(job["series_key"]) == job["part"]:
+            topics.append(job["topic"])
+    return topics
+
+
+def _plan():
+    """Print what a run would do, without claiming parts or loading render/upload code."""
+    state.set_read_only()
+    if not state.exists():
+        print(f"No state yet ({state.db_path()} does not exist)")
+    topics = get_trends(claim=False)
+    print(f"Would produce {len(topics)} videos:" if topics else "No topics due")
+    for topic in topics:
+        meta = topic["meta"]
+        series = state.get_series(meta["series_key"])
+        total = series["parts_per_series"] if series else os.environ.get("PARTS_PER_SERIES", "8")
+        print(f"  {meta['series_key']}  part {meta['part']}/{total}")
+    unfinished = jobs.unfinished_jobs()
+    if unfinished:
+        print(f"{len(unfinished)} unfinished jobs (python -m scripts.main --resume):")
+        for job in unfinished:
+            todo = [n for n, s in job["stages"].items() if s["status"] not in ("done", "skipped")]
+            print(f"  {job['id']}  {job['status']}: {', '.join(todo)}")
+    queued = outbox.counts()
+    if queued.get("pending") or queued.get("sending"):
+        print(f"Outbox: {queued.get('pending', 0)} pending, {queued.get('sending', 0)} sending")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Moneybot Shorts pipeline")
+    parser.add_argument("--resume", action="store_true", help="continue unfinished jobs instead of starting new parts")
+    parser.add_argument("--plan", action="store_true", help="print what would be produced and exit")
+    parser.add_argument("--daemon", action="store_true", help="keep running and produce on a schedule")
+    parser.add_argument("--every", default=os.environ.get("DAEMON_INTERVAL"), help="daemon interval, e.g. 90m or 8h")
+    parser.add_argument("--cron", default=os.environ.get("DAEMON_CRON"), help='daemon cron schedule (UTC), e.g. "7 6,12,18 * * *"')
+    args = parser.parse_args(argv)
+
+    if args.plan:
+        return _plan()
+    if args.daemon:
+        from .daemon import serve
+        return serve(every=args.every, cron=args.cron)
+
+    # the dispatcher also delivers whatever earlier runs left in the outbox
+    if args.resume:
+        # retrying deliveries that ran out of attempts is an explicit decision, never a scheduled one
+        rearmed = outbox.rearm()
+        if rearmed:
+            print(f"Rearmed {rearmed} failed deliveries")
+    with outbox.Dispatcher(PUBLISH_TARGETS):
+        produced = run(resume=args.resume)
+    if produced is not None:
+        print(trace.summary_table())
+
+
+def run(resume: bool = False, render_pool=None):
+    """
+    One production run: pick the due topics (or unfinished jobs) and produce
+    them. Returns the number of videos produced, or None if nothing was due.
+    Publishing is left to the outbox dispatcher the caller keeps open.
+    """
+    language = os.environ.get("LANGUAGE", "en")
+    affiliate_url = os.environ.get("AFFILIATE_URL")
+    workers = int(os.environ.get("PIPELINE_WORKERS", "1"))
+    ensure_dir("out")
+
+    topics = _resumable_topics() if resume else get_trends()
+    if not topics:
+        print("No unfinished jobs" if resume else "No topics found")
+        return None
+
+    trace.event("run_start", topics=len(topics), workers=workers, resume=resume)
+    start = time.perf_counter()
+    if workers > 1 and len(topics) > 1:
+        produced = _run_concurrent(topics, language, affiliate_url, min(workers, len(topics)), render_pool)
+    else:
+        produced = _run_sequential(topics, language, affiliate_url)
+    trace.event("run_end", produced=produced, duration_s=round(time.perf_counter() - start, 3),
+                outbox=outbox.counts(), ratelimit=ratelimit.stats())
 
     print(f"Produced {produced} videos.")
+    artifacts.collect()
+    return produced
 
 
 if __name__ == "__main__":
@@ -0,0 +1,248 @@
+"""
+outbox.py
+---------
+
+Persistent publish outbox. A rendered video is enqueued once per target
+(Bluesky, YouTube) in the `outbox` table of the state database, and a
+`Dispatcher` delivers due entries on a thread pool in the background, so
+content generation keeps going while uploads drain and a target that is down
+never blocks production.
+
+Each entry is keyed by `<job id>:<target>`, which doubles as its idempotency
+key: enqueueing the same job again is a no-op and a delivered entry is never
+sent twice. Failed deliveries are retried with exponential backoff per entry
+until `OUTBOX_MAX_ATTEMPTS`; whatever is still pending when a run ends is
+picked up by the next run's dispatcher.
+
+Environment variables
+---------------------
+OUTBOX_WORKERS        Concurrent deliveries (default 4).
+OUTBOX_MAX_ATTEMPTS   Attempts per entry before it is marked failed (default 6).
+OUTBOX_RETRY_BASE     Backoff after the first failure in seconds, doubled per attempt (default 30).
+OUTBOX_DRAIN_TIMEOUT  Seconds a run waits at the end for retries that fall due (default 300).
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from . import state
+
+# a delivery that has not reported back within this time is assumed lost (process killed)
+CLAIM_TTL = 3600
+MAX_BACKOFF = 3600
+
+_wakeup = threading.Event()
+
+
+def entry_id(job_id: str, target: str) -> str:
+    return f"{job_id}:{target}"
+
+
+def _row_to_entry(row) -> Dict:
+    entry = dict(row)
+    entry["payload"] = json.loads(entry["payload"])
+    return entry
+
+
+def enqueue(job_id: str, deliveries: Dict[str, Dict]) -> None:
+    """
+    Queue one entry per target for `job_id`. Existing entries, including
+    permanently failed ones, are kept as they are (see `rearm`).
+    """
+    now = time.time()
+    with state.transaction() as conn:
+        for target, payload in deliveries.items():
+            conn.execute(
+                "INSERT OR IGNORE INTO outbox (id, job_id, target, payload, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry_id(job_id, target), job_id, target, json.dumps(payload, ensure_ascii=False), now, now, now),
+            )
+    _wakeup.set()
+
+
+def rearm() -> int:
+    """Give every permanently failed entry a fresh set of attempts (`--resume`); returns how many."""
+    now = time.time()
+    with state.transaction() as conn:
+        cur = conn.execute(
+            "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ? "
+            "WHERE status = 'failed'",
+            (now, now),
+        )
+    _wakeup.set()
+    return cur.rowcount
+
+
+def get_entry(eid: str) -> Optional[Dict]:
+    row = state.connect().execute("SELECT * FROM outbox WHERE id = ?", (eid,)).fetchone()
+    return _row_to_entry(row) if row else None
+
+
+def claim_due(limit: int, targets=None) -> List[Dict]:
+    """Atomically mark up to `limit` due entries as sending and return them."""
+    if limit <= 0:
+        return []
+    now = time.time()
+    with state.transaction() as conn:
+        rows = conn.execute(
+            "SELECT * FROM outbox WHERE (status = 'pending' AND next_attempt_at <= ?) "
+            "OR (status = 'sending' AND claimed_until < ?) ORDER BY next_attempt_at LIMIT ?",
+            (now, now, limit if targets is None else -1),
+        ).fetchall()
+        if targets is not None:
+            rows = [r for r in rows if r["target"] in targets][:limit]
+        conn.executemany(
+            "UPDATE outbox SET status = 'sending', claimed_until = ?, updated_at = ? WHERE id = ?",
+            [(now + CLAIM_TTL, now, r["id"]) for r in rows],
+        )
+    return [_row_to_entry(r) for r in rows]
+
+
+def next_due() -> Optional[float]:
+    row = state.connect().execute(
+        "SELECT MIN(next_attempt_at) AS t FROM outbox WHERE status = 'pending'"
+    ).fetchone()
+    return row["t"]
+
+
+def _record(entry: Dict, result: Optional[str], error: Optional[str], max_attempts: int, retry_base: float) -> None:
+    now = time.time()
+    attempts = entry["attempts"] + 1
+    if error is None:
+        status, next_at = "done", entry["next_attempt_at"]
+    elif attempts >= max_attempts:
+        status, next_at = "failed", entry["next_attempt_at"]
+    else:
+        status, next_at = "pending", now + min(retry_base * 2 ** (attempts - 1), MAX_BACKOFF)
+    with state.transaction() as conn:
+        conn.execute(
+            "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, claimed_until = NULL, "
+            "result = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, attempts, next_at, result, error, now, entry["id"]),
+        )
+
+
+def counts() -> Dict[str, int]:
+    rows = state.connect().execute("SELECT status, COUNT(*) AS n FROM outbox GROUP BY status").fetchall()
+    return {r["status"]: r["n"] for r in rows}
+
+
+class Dispatcher:
+    """
+    Background delivery of outbox entries:
+
+        with outbox.Dispatcher({"youtube": deliver_youtube}) as dispatcher:
+            ...  # enqueue() wakes the dispatcher
+
+    Each target callable takes the entry dict and returns a result string
+    (post URI, video id) or raises. Leaving the block drains in-flight
+    deliveries and retries that fall due within `drain_timeout`.
+
+    A pass that fails (e.g. the database stays locked) is logged and retried
+    with backoff; `alive()` tells whether the thread is still running.
+    """
+
+    def __init__(self, targets: Dict[str, Callable[[Dict], str]], workers: int = None,
+                 max_attempts: int = None, retry_base: float = None, drain_timeout: float = None):
+        env = os.environ.get
+        self.targets = targets
+        self.workers = workers or int(env("OUTBOX_WORKERS", "4"))
+        self.max_attempts = max_attempts or int(env("OUTBOX_MAX_ATTEMPTS", "6"))
+        self.retry_base = float(env("OUTBOX_RETRY_BASE", "30")) if retry_base is None else retry_base
+        self.drain_timeout = float(env("OUTBOX_DRAIN_TIMEOUT", "300")) if drain_timeout is None else drain_timeout
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="outbox")
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self._closing_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self._thread = threading.Thread(target=self._loop, name="outbox-dispatcher", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _deliver(self, entry: Dict) -> None:
+        result, error = None, None
+        try:
+            result = self.targets[entry["target"]](entry)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"{entry['target']} delivery of {entry['job_id']} failed (attempt {entry['attempts'] + 1}): {error}")
+        try:
+            _record(entry, result, error, self.max_attempts, self.retry_base)
+        except Exception as e:
+            # the entry stays claimed and is picked up again once its claim expires
+            print(f"Could not record the {entry['target']} delivery of {entry['job_id']}: {type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._inflight -= 1
+            _wakeup.set()
+
+    def alive(self) -> bool:
+        """Whether the dispatcher thread is (still) running."""
+        return self._thread.is_alive()
+
+    def _loop(self) -> None:
+        failures = 0
+        while True:
+            try:
+                if self._pass():
+                    return
+                failures = 0
+            except Exception as e:
+                # e.g. the database is locked for longer than the busy timeout: keep delivering afterwards
+                failures += 1
+                self.error = f"{type(e).__name__}: {e}"
+                if self._closing_at is not None and time.time() > self._closing_at + self.drain_timeout:
+                    print(f"Outbox dispatcher giving up after {failures} failed passes: {self.error}")
+                    return
+                backoff = min(2 ** failures, 30)
+                print(f"Outbox dispatcher pass failed, retrying in {backoff}s: {self.error}")
+                time.sleep(backoff)
+
+    def _pass(self) -> bool:
+        """Claim and submit due entries, then wait for the next one; True once closed and drained."""
+        with self._lock:
+            free = self.workers - self._inflight
+        claimed = claim_due(free, self.targets)
+        with self._lock:
+            self._inflight += len(claimed)
+        for entry in claimed:
+            self._pool.submit(self._deliver, entry)
+        with self._lock:
+            idle = self._inflight == 0
+        due = next_due()
+        if self._closing_at is not None and idle and not claimed:
+            if due is None or due > self._closing_at + self.drain_timeout:
+                return True
+        wait = 1.0 if due is None else min(max(due - time.time(), 0.05), 1.0)
+        _wakeup.wait(wait)
+        _wakeup.clear()
+        return False
+
+    def close(self) -> None:
+        """
+        Stop after in-flight deliveries and soon-due retries are done. Raises
+        if the dispatcher thread had died before, since nothing was delivered
+        from then on.
+        """
+        died = self._thread.ident is not None and not self._thread.is_alive()
+        self._closing_at = time.time()
+        _wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._pool.shutdown(wait=True)
+        pending = counts().get("pending", 0)
+        if pending:
+            print(f"{pending} publish deliveries left in the outbox for the next run")
+        if died:
+            raise RuntimeError(f"outbox dispatcher stopped unexpectedly (last error: {self.error or 'unknown'}); "
+                               f"{pending} deliveries are still pending")
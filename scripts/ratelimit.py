@@ -0,0 +1,244 @@
+"""
+ratelimit.py
+------------
+
+Shared rate limiting and retry policy for every outbound API call (OpenAI
+chat, images and speech, Bluesky, YouTube), so concurrent topics stay inside
+the provider quotas instead of failing on avoidable throttling:
+
+    text = ratelimit.call("openai", "gpt-4o-mini", lambda: client.chat.completions.create(...),
+                          tokens=estimate)
+
+* A token bucket per provider/model limits requests per minute and, where
+  given, tokens per minute. A 429 pauses the whole bucket, not just the
+  thread that hit it.
+* A semaphore per provider caps concurrent calls.
+* 429, 5xx and connection errors are retried with exponential backoff and
+  full jitter; a `Retry-After` (or Bluesky `ratelimit-reset`) header wins.
+* Counters per provider/model (calls, retries, throttled, seconds spent
+  waiting for the bucket, failures) are available from `stats()` and are
+  written to the run log at the end of a run; retries also count on the
+  current trace span.
+
+Environment variables
+---------------------
+RATE_LIMITS        Overrides, e.g. `openai/gpt-4o-mini=500:200000,bluesky=30`
+                   (requests per minute, optional `:tokens per minute`).
+RATE_CONCURRENCY   Concurrent calls per provider, e.g. `openai=8,youtube=1`.
+RETRY_ATTEMPTS     Attempts per call including the first (default 5).
+RETRY_MAX_DELAY    Cap for one backoff sleep in seconds (default 60).
+"""
+
+import email.utils
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from . import trace
+
+# requests/min and tokens/min (None = unlimited), conservative defaults for a low usage tier
+DEFAULT_LIMITS: Dict[str, Tuple[float, Optional[float]]] = {
+    "openai/gpt-4o-mini": (500, 200_000),
+    "openai/gpt-image-1": (5, None),
+    "openai/tts-1": (50, None),
+    "bluesky": (30, None),
+    "youtube": (10, None),
+}
+DEFAULT_CONCURRENCY = {"openai": 8, "bluesky": 2, "youtube": 2}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_lock = threading.Lock()
+_buckets: Dict[str, "Bucket"] = {}
+_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def _parse_pairs(value: str) -> Dict[str, str]:
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {k.strip(): v.strip() for k, v in pairs}
+
+
+class Bucket:
+    """Requests and tokens per minute, refilled continuously; a full minute may burst."""
+
+    def __init__(self, rpm: float, tpm: Optional[float] = None):
+        self.rpm, self.tpm = rpm, tpm
+        self._requests = rpm
+        self._tokens = tpm or 0.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens: float = 0) -> float:
+        """Block until one request (and `tokens`) fits; return the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                # a single call larger than the whole budget only waits for a full bucket
+                need = min(tokens, self.tpm) if self.tpm else 0
+                wait = max(
+                    self._paused_until - now,
+                    (1 - self._requests) * 60 / self.rpm,
+                    (need - self._tokens) * 60 / self.tpm if self.tpm else 0,
+                )
+                if wait <= 0:
+                    self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= need
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _key(provider: str, model: str = None) -> str:
+    return f"{provider}/{model}" if model else provider
+
+
+def bucket(provider: str, model: str = None) -> Bucket:
+    key = _key(provider, model)
+    with _lock:
+        if key not in _buckets:
+            limits = dict(DEFAULT_LIMITS)
+            for k, v in _parse_pairs(os.environ.get("RATE_LIMITS", "")).items():
+                rpm, _, tpm = v.partition(":")
+                limits[k] = (float(rpm), float(tpm) if tpm else None)
+            rpm, tpm = limits.get(key) or limits.get(provider) or (600, None)
+            _buckets[key] = Bucket(rpm, tpm)
+        return _buckets[key]
+
+
+def _semaphore(provider: str) -> threading.BoundedSemaphore:
+    with _lock:
+        if provider not in _semaphores:
+            caps = {**DEFAULT_CONCURRENCY, **{k: int(v) for k, v in _parse_pairs(os.environ.get("RATE_CONCURRENCY", "")).items()}}
+            _semaphores[provider] = threading.BoundedSemaphore(caps.get(provider, 4))
+        return _semaphores[provider]
+
+
+def _count(key: str, **deltas) -> None:
+    with _lock:
+        s = _stats.setdefault(key, {"calls": 0, "retries": 0, "throttled": 0, "wait_s": 0.0, "failures": 0})
+        for name, delta in deltas.items():
+            s[name] += delta
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    with _lock:
+        return {k: {**v, "wait_s": round(v["wait_s"], 3)} for k, v in _stats.items()}
+
+
+# -------- Error classification --------
+
+def _response(e: Exception):
+    # openai / httpx / atproto errors carry `.response`, googleapiclient's HttpError `.resp`
+    return getattr(e, "response", None) or getattr(e, "resp", None)
+
+
+def status_of(e: Exception) -> Optional[int]:
+    for obj in (e, _response(e)):
+        for attr in ("status_code", "status"):
+            value = getattr(obj, attr, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def retry_after(e: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, from `Retry-After` or `ratelimit-reset`."""
+    headers = getattr(_response(e), "headers", None)
+    if headers is None and isinstance(_response(e), dict):
+        headers = _response(e)
+    if not headers:
+        return None
+    get = lambda name: headers.get(name) or headers.get(name.title())  # noqa: E731
+    value = get("retry-after")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            parsed = email.utils.parsedate_to_datetime(value)
+            return max(0.0, parsed.timestamp() - time.time())
+    reset = get("ratelimit-reset")
+    if reset:
+        try:
+            return max(0.0, float(reset) - time.time())
+        except ValueError:
+            return None
+    return None
+
+
+def is_retryable(e: Exception, statuses=RETRY_STATUSES) -> bool:
+    status = status_of(e)
+    if status is not None:
+        return status in statuses
+    # transport failures: builtin and SDK connection/timeout errors
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return True
+    return any(c.__name__ in ("APIConnectionError", "APITimeoutError", "NetworkError", "TransportError",
+                              "HttpLib2Error", "ServerNotFoundError")
+               for c in type(e).__mro__)
+
+
+def backoff_delay(attempt: int, e: Exception = None, base: float = 1.0) -> float:
+    """Full-jitter exponential backoff for retry `attempt` (1-based); Retry-After wins."""
+    cap = float(os.environ.get("RETRY_MAX_DELAY", "60"))
+    hinted = retry_after(e) if e is not None else None
+    if hinted is not None:
+        return min(hinted + random.uniform(0, 1), cap * 5)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# -------- Public API --------
+
+@contextmanager
+def slot(provider: str, model: str = None, tokens: float = 0):
+    """Hold a concurrency slot and one request from the bucket for the duration of the block."""
+    key = _key(provider, model)
+    with _semaphore(provider):
+        waited = bucket(provider, model).acquire(tokens)
+        _count(key, calls=1, wait_s=waited)
+        yield
+
+
+def call(provider: str, model: Optional[str], fn: Callable, tokens: float = 0, attempts: int = None,
+         statuses=RETRY_STATUSES):
+    """
+    Run `fn()` under the provider limits, retrying throttling and transient
+    failures. `statuses` narrows what is retried for calls that are not safe
+    to repeat after a server error (e.g. creating a post).
+    """
+    attempts = attempts or int(os.environ.get("RETRY_ATTEMPTS", "5"))
+    key = _key(provider, model)
+    for attempt in range(1, attempts + 1):
+        try:
+            with slot(provider, model, tokens):
+                return fn()
+        except Exception as e:
+            if status_of(e) == 429:
+                _count(key, throttled=1)
+                hinted = retry_after(e)
+                bucket(provider, model).pause(hinted if hinted is not None else 1.0)
+            if attempt == attempts or not is_retryable(e, statuses):
+                _count(key, failures=1)
+                raise
+            delay = backoff_delay(attempt, e)
+            print(f"{key} call failed ({status_of(e) or type(e).__name__}), retry {attempt} in {delay:.1f}s")
+            _count(key, retries=1)
+            trace.add_retry()
+            time.sleep(delay)
@@ -0,0 +1,286 @@
+"""
+render.py
+---------
+
+Direct ffmpeg pipe renderer. Every frame is composited with NumPy into one
+preallocated buffer and streamed as raw RGB into an ffmpeg subprocess, instead
+of going through MoviePy's CompositeVideoClip. Produces the same
+`(video_path, thumb_path)` output as the MoviePy path in `video.py`.
+
+Selected with `RENDER_ENGINE=ffmpeg` (the default); see `video.create_video`.
+
+With `RENDER_CHUNKS` > 1 (default: `os.cpu_count()`, divided by the renders a
+pipeline process pool runs side by side) the timeline is split into that
+many segments, each rendered and encoded in its own process, then
+joined with ffmpeg's concat demuxer without re-encoding; the audio is muxed
+once at the end. The background master is prepared once (`assets.py`) and
+memory-mapped by every process.
+
+The narration's duration comes from its headers (`audio.probe`) and AAC,
+Opus or MP3 narration is stream-copied into the MP4 and cut with `-t`, so
+the audio is never decoded or re-encoded; only WAV falls back to AAC encoding.
+
+Every output variant comes from the same single pass over the frames:
+
+RENDER_PREVIEW          Size of an extra low-bitrate preview, e.g. `720x1280`
+                        (`out/<slug>_preview.mp4`); empty (default) for none.
+                        The encoder splits the frame stream, nothing is rendered twice.
+RENDER_PREVIEW_BITRATE  Video bitrate of the preview (default 800k).
+THUMBNAIL_AT            Second of the video used as the thumbnail (default 0),
+                        saved straight from the frame buffer.
+"""
+
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import assets, audio, encode
+from .ffmpeg import ffmpeg_exe, run_ffmpeg
+from .subtitles import Caption
+from .util import process_context
+from .zoom import KenBurns
+
+WIDTH, HEIGHT, FPS = 1080, 1920, 30
+
+# videos rendered side by side in this machine's render pool (see `share_cores`)
+_parallel_renders = 1
+
+
+class Overlay(NamedTuple):
+    """A premultiplied RGBA bitmap shown between `start` and `end` seconds."""
+    start: float
+    end: float
+    x: int
+    y: int
+    premul: np.ndarray  # (h, w, 3) uint16, rgb * alpha
+    inv_alpha: np.ndarray  # (h, w, 1) uint16, 255 - alpha
+
+
+def overlay_from_caption(caption: Caption, start: float, end: float, x: int, y: int) -> Overlay:
+    """Position a premultiplied caption, clipped to the frame (views, no copies)."""
+    h, w = caption.height, caption.width
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, WIDTH), min(y + h, HEIGHT)
+    rows, cols = slice(y0 - y, y1 - y), slice(x0 - x, x1 - x)
+    return Overlay(start, end, x0, y0, caption.premul[rows, cols], caption.inv_alpha[rows, cols])
+
+
+def blend_overlay(frame: np.ndarray, ov: Overlay, scratch: np.ndarray) -> None:
+    """Alpha-blend `ov` into `frame` in place using integer math."""
+    h, w = ov.premul.shape[:2]
+    region = frame[ov.y:ov.y + h, ov.x:ov.x + w]
+    tmp = scratch[:h, :w]
+    np.multiply(region, ov.inv_alpha, out=tmp, casting="unsafe")
+    tmp += ov.premul
+    tmp += 127
+    tmp //= 255
+    region[...] = tmp
+
+
+def render_frames(
+    bg: KenBurns,
+    overlays: List[Overlay],
+    duration: float,
+    fps: int = FPS,
+    start: int = 0,
+    stop: Optional[int] = None,
+):
+    """Yield composited frames `start..stop`; the same buffer is reused for every frame."""
+    frame = np.empty((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    scratch = np.empty((HEIGHT, WIDTH, 3), dtype=np.uint16)
+    if stop is None:
+        stop = frame_count(duration, fps)
+    for i in range(start, stop):
+        t = i / fps
+        np.copyto(frame, bg.frame(t))
+        for ov in overlays:
+            if ov.start <= t < ov.end:
+                blend_overlay(frame, ov, scratch)
+        yield frame
+
+
+def frame_count(duration: float, fps: int = FPS) -> int:
+    return int(math.ceil(duration * fps))
+
+
+def preview_size() -> Optional[Tuple[int, int]]:
+    """RENDER_PREVIEW as (width, height), e.g. `720x1280`; None when no preview is wanted."""
+    value = os.environ.get("RENDER_PREVIEW", "").strip().lower()
+    if value in ("", "0", "off"):
+        return None
+    w, _, h = value.partition("x")
+    return int(w), int(h)
+
+
+def preview_path(video_path: str) -> str:
+    root, ext = os.path.splitext(video_path)
+    return f"{root}_preview{ext}"
+
+
+def thumbnail_index(duration: float, fps: int = FPS) -> int:
+    """Frame shown as the thumbnail: THUMBNAIL_AT seconds (default 0), clamped to the clip."""
+    at = float(os.environ.get("THUMBNAIL_AT", "0"))
+    return min(max(round(at * fps), 0), frame_count(duration, fps) - 1)
+
+
+def _audio_output(audio_path: str, duration: float) -> List[str]:
+    """Mapping, trim and codec for muxing the narration (input 1) into one output."""
+    return ["-map", "1:a", "-t", f"{duration:.3f}", *audio.mp4_audio_args(audio.probe(audio_path))]
+
+
+def _h264_args(threads: int, bitrate: str = None) -> List[str]:
+    args = ["-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-threads", str(threads)]
+    if bitrate:
+        args += ["-b:v", bitrate, "-maxrate", bitrate, "-bufsize", bitrate]
+    return args
+
+
+def _encoder_cmd(video_path: str, fps: int, audio_path: str = None, duration: float = None, threads: int = 2,
+                 preview: str = None) -> List[str]:
+    """
+    ffmpeg command reading raw frames from stdin. With `preview`, a split
+    filter fans the same frames out to a second, scaled low-bitrate output,
+    so extra variants never cost another pass of frame generation.
+    """
+    cmd = [
+        ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{WIDTH}x{HEIGHT}", "-r", str(fps), "-i", "-",
+    ]
+    if audio_path:
+        cmd += ["-i", audio_path]
+    outputs = [("0:v", video_path, _h264_args(threads))]
+    if preview:
+        pw, ph = preview_size()
+        cmd += ["-filter_complex", f"[0:v]split=2[full][small];[small]scale={pw}:{ph}[preview]"]
+        bitrate = os.environ.get("RENDER_PREVIEW_BITRATE", "800k")
+        outputs = [("[full]", video_path, _h264_args(threads)), ("[preview]", preview, _h264_args(1, bitrate))]
+    for source, path, video_args in outputs:
+        cmd += ["-map", source]
+        if audio_path:
+            cmd += _audio_output(audio_path, duration)
+        cmd += [*video_args, "-movflags", "+faststart", path]
+    return cmd
+
+
+def _frame_source(image_path: str, script: str, duration: float, timings=None):
+    from .video import subtitle_overlays
+
+    bg = KenBurns.from_env(assets.background(image_path, duration), duration)
+    return bg, subtitle_overlays(script, duration, timings)
+
+
+def _encode(cmd: List[str], frames, thumb_path: Optional[str] = None, thumb_index: int = 0) -> None:
+    """Stream raw frames into ffmpeg; frame `thumb_index` doubles as the thumbnail."""
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    try:
+        for i, frame in enumerate(frames):
+            if i == thumb_index and thumb_path:
+                # Thumbnail straight from the buffer, no second composite or decode
+                encode.encode_file(frame, "archive", thumb_path)
+            proc.stdin.write(frame.data)
+        proc.stdin.close()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    if proc.wait() != 0:
+        raise RuntimeError(f"ffmpeg exited with status {proc.returncode}")
+
+
+def _render_segment(image_path, script, duration, timings, start, stop, seg_path, preview_seg, thumb_path):
+    """Process-pool worker: render and encode frames `start..stop` without audio."""
+    bg, overlays = _frame_source(image_path, script, duration, timings)
+    frames = render_frames(bg, overlays, duration, FPS, start, stop)
+    thumb_index = thumbnail_index(duration) - start
+    _encode(_encoder_cmd(seg_path, FPS, threads=1, preview=preview_seg), frames, thumb_path, thumb_index)
+    return seg_path
+
+
+def _concat(seg_paths: List[str], list_path: str, audio_path: str, duration: float, out_path: str) -> None:
+    """Join encoded segments without re-encoding and mux the narration."""
+    with open(list_path, "w", encoding="utf-8") as f:
+        for p in seg_paths:
+            f.write(f"file '{os.path.abspath(p)}'\n")
+    run_ffmpeg([
+        "-f", "concat", "-safe", "0", "-i", list_path, "-i", audio_path,
+        "-map", "0:v", *_audio_output(audio_path, duration),
+        "-c:v", "copy", "-movflags", "+faststart",
+        out_path,
+    ])
+
+
+def share_cores(renders: int) -> None:
+    """Pool initializer: `renders` videos render at once, so each chunks over its share of the cores."""
+    global _parallel_renders
+    _parallel_renders = max(1, renders)
+
+
+def _chunk_count(n_frames: int) -> int:
+    """RENDER_CHUNKS (default: this render's share of the cores), but never segments shorter than a second."""
+    chunks = int(os.environ.get("RENDER_CHUNKS", "0")) or (os.cpu_count() or 1) // _parallel_renders
+    return max(1, min(chunks, n_frames // FPS))
+
+
+def _render_chunked(image_path, audio_path, script, duration, timings, chunks, video_path, thumb_path, preview=None):
+    """
+    Split the timeline into `chunks` segments rendered in parallel processes,
+    join them with the concat demuxer (no re-encode) and mux the audio once.
+    Each worker also writes its slice of the preview, joined the same way.
+    """
+    n = frame_count(duration)
+    bounds = [n * k // chunks for k in range(chunks + 1)]
+    thumb_index = thumbnail_index(duration)
+    seg_dir = tempfile.mkdtemp(prefix="segments-", dir=os.path.dirname(video_path) or ".")
+    try:
+        seg_paths = [os.path.join(seg_dir, f"{k:03d}.mp4") for k in range(chunks)]
+        preview_segs = [os.path.join(seg_dir, f"{k:03d}_preview.mp4") if preview else None for k in range(chunks)]
+        with ProcessPoolExecutor(max_workers=chunks, mp_context=process_context()) as pool:
+            futures = [
+                pool.submit(
+                    _render_segment, image_path, script, duration, timings,
+                    bounds[k], bounds[k + 1], seg_paths[k], preview_segs[k],
+                    thumb_path if bounds[k] <= thumb_index < bounds[k + 1] else None,
+                )
+                for k in range(chunks)
+            ]
+            for f in futures:
+                f.result()
+
+        _concat(seg_paths, os.path.join(seg_dir, "segments.txt"), audio_path, duration, video_path)
+        if preview:
+            _concat(preview_segs, os.path.join(seg_dir, "preview.txt"), audio_path, duration, preview)
+    finally:
+        shutil.rmtree(seg_dir, ignore_errors=True)
+
+
+def render_video_ffmpeg(
+    image_path: str,
+    audio_path: str,
+    script: str,
+    slug: str,
+    out_dir: str = "out",
+) -> tuple[str, str]:
+    os.makedirs(out_dir, exist_ok=True)
+    duration = assets.render_duration(audio_path)
+    # prepared once here (a no-op after the assets stage), then mapped by every worker
+    assets.prepare_background(image_path, duration)
+
+    video_path = os.path.join(out_dir, f"{slug}.mp4")
+    thumb_path = os.path.join(out_dir, f"{slug}_thumb{encode.extension('archive')}")
+    preview = preview_path(video_path) if preview_size() else None
+
+    timings = audio.load_timings(audio_path)
+    chunks = _chunk_count(frame_count(duration))
+    if chunks > 1:
+        _render_chunked(image_path, audio_path, script, duration, timings, chunks, video_path, thumb_path, preview)
+    else:
+        bg, overlays = _frame_source(image_path, script, duration, timings)
+        cmd = _encoder_cmd(video_path, FPS, audio_path, duration, preview=preview)
+        _encode(cmd, render_frames(bg, overlays, duration), thumb_path, thumbnail_index(duration))
+    return video_path, thumb_path
@@ -0,0 +1,196 @@
+"""
+sessions.py
+-----------
+
+Shared clients and authenticated sessions, so every video does not pay for
+fresh TLS handshakes and auth round trips:
+
+* `openai_client()` is one OpenAI client (with its pooled HTTP connections)
+  for chat, images and speech.
+* `bluesky_client()` logs in once and persists the session in the sessions
+  database; later runs import it and let atproto refresh the tokens instead of
+  calling `createSession` again, which is heavily rate-limited.
+* `youtube_credentials()` keeps the OAuth access token (in memory and in the
+  sessions database) until shortly before it expires.
+* `youtube_service()` builds the API client from a discovery document parsed
+  once per process (the copy bundled with google-api-python-client, or one
+  fetched once into `.cache/discovery/`).
+
+The tokens are kept in `state/sessions.db` (`SESSIONS_DB`), apart from the
+state database, so they never travel with a copy of the state such as the
+CI cache. It must be a different file from `STATE_DB`.
+
+Environment variables
+---------------------
+SESSIONS_DB          Where login sessions are stored (default `state/sessions.db`).
+DISCOVERY_CACHE_DIR  Where a downloaded discovery document is kept (default `.cache/discovery`).
+BLUESKY_SERVICE      XRPC root of the Bluesky PDS (default `https://bsky.social/xrpc`).
+"""
+
+import json
+import os
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional
+
+from . import ratelimit, state
+from .util import ensure_dir
+
+YT_SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
+# refresh the YouTube token this many seconds before it actually expires
+TOKEN_MARGIN = 120
+
+# one lock per service, so a slow login or token refresh on one never holds up the other
+_bluesky_lock = threading.Lock()
+_youtube_lock = threading.Lock()
+_local = threading.local()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def _db_path() -> str:
+    return os.environ.get("SESSIONS_DB", os.path.join("state", "sessions.db"))
+
+
+def load_session(name: str) -> Optional[str]:
+    row = state.connect(_db_path(), _SCHEMA).execute("SELECT value FROM sessions WHERE name = ?", (name,)).fetchone()
+    return row["value"] if row else None
+
+
+def save_session(name: str, value: str) -> None:
+    with state.transaction(_db_path(), _SCHEMA) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (name, value, updated_at) VALUES (?, ?, ?)",
+            (name, value, time.time()),
+        )
+
+
+def drop_session(name: str) -> None:
+    with state.transaction(_db_path(), _SCHEMA) as conn:
+        conn.execute("DELETE FROM sessions WHERE name = ?", (name,))
+
+
+@lru_cache(maxsize=1)
+def openai_client():
+    # created on first use so modules can be imported without credentials
+    from openai import OpenAI
+    # retries are handled by ratelimit.call, with backoff shared across threads
+    return OpenAI(max_retries=0)
+
+
+@lru_cache(maxsize=None)
+def _bluesky_client(handle: str, password: str):
+    from atproto import Client, SessionEvent
+
+    name = f"bluesky:{handle}"
+    client = Client(os.environ.get("BLUESKY_SERVICE") or None)
+
+    def _persist(event, session):
+        if event in (SessionEvent.CREATE, SessionEvent.REFRESH):
+            save_session(name, session.encode())
+
+    client.on_session_change(_persist)
+    saved = load_session(name)
+    if saved:
+        try:
+            ratelimit.call("bluesky", None, lambda: client.login(session_string=saved))
+            return client
+        except Exception as e:
+            print(f"Saved Bluesky session unusable, logging in again: {e}")
+            drop_session(name)
+    ratelimit.call("bluesky", None, lambda: client.login(handle, password))
+    return client
+
+
+def bluesky_client(handle: str, password: str):
+    """Logged-in atproto `Client` for `handle`, shared for the whole process."""
+    with _bluesky_lock:
+        return _bluesky_client(handle, password)
+
+
+@lru_cache(maxsize=None)
+def _youtube_credentials(client_id: str, client_secret: str, refresh_token: str, token_uri: str):
+    from google.oauth2.credentials import Credentials
+
+    token, expiry = None, None
+    saved = load_session(f"youtube:{client_id}")
+    if saved:
+        saved = json.loads(saved)
+        token = saved["token"]
+        # google-auth compares against naive UTC datetimes
+        expiry = datetime.fromtimestamp(saved["expiry"], timezone.utc).replace(tzinfo=None)
+    return Credentials(
+        token,
+        refresh_token=refresh_token,
+        token_uri=token_uri,
+        client_id=client_id,
+        client_secret=client_secret,
+        scopes=YT_SCOPES,
+        expiry=expiry,
+    )
+
+
+def youtube_credentials(client_id: str, client_secret: str, refresh_token: str,
+                        token_uri: str = "https://oauth2.googleapis.com/token"):
+    """OAuth credentials with a valid access token, refreshed only when it is about to expire."""
+    from google.auth.transport.requests import Request
+
+    with _youtube_lock:
+        creds = _youtube_credentials(client_id, client_secret, refresh_token, token_uri)
+        expires_in = (creds.expiry - datetime.utcnow()).total_seconds() if creds.expiry else 0
+        if not creds.token or expires_in < TOKEN_MARGIN:
+            ratelimit.call("youtube", "oauth", lambda: creds.refresh(Request()))
+            expiry = creds.expiry.replace(tzinfo=timezone.utc).timestamp()
+            save_session(f"youtube:{client_id}", json.dumps({"token": creds.token, "expiry": expiry}))
+    return creds
+
+
+@lru_cache(maxsize=None)
+def discovery_document(service: str, version: str) -> str:
+    """The API discovery document, read from the library or a local cache, fetched at most once."""
+    from googleapiclient.discovery_cache import get_static_doc
+
+    doc = get_static_doc(service, version)
+    if doc:
+        return doc
+    cache_dir = os.environ.get("DISCOVERY_CACHE_DIR", os.path.join(".cache", "discovery"))
+    path = os.path.join(cache_dir, f"{service}.{version}.json")
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    url = f"https://{service}.googleapis.com/$discovery/rest?version={version}"
+    with urllib.request.urlopen(url, timeout=30) as resp:
+        doc = resp.read().decode("utf-8")
+    ensure_dir(cache_dir)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(doc)
+    return doc
+
+
+def youtube_service(creds, api_endpoint: str = None):
+    """
+    YouTube Data API client. httplib2 connections are not thread-safe, so the
+    client is cached per thread (outbox deliveries run on a thread pool).
+    """
+    from googleapiclient.discovery import build_from_document
+
+    services = getattr(_local, "youtube", None)
+    if services is None:
+        services = _local.youtube = {}
+    key = (id(creds), api_endpoint)
+    if key not in services:
+        options = {"api_endpoint": api_endpoint} if api_endpoint else None
+        services[key] = build_from_document(
+            discovery_document("youtube", "v3"), credentials=creds, client_options=options
+        )
+    return services[key]
@@ -0,0 +1,328 @@
+"""
+state.py
+--------
+
+Transactional series state store backed by SQLite (`state/series.db`, or
+`STATE_DB`). Every update is a single transaction, so a crash can never leave
+a half-written state behind, and several workers or processes can share the
+database: WAL mode lets readers run alongside a writer and `claim_next_part`
+reserves a part atomically so no two workers produce the same episode.
+
+The legacy `state/series.json` file is imported once when the database is
+first created. A file that fails to parse is left untouched and reported
+instead of silently resetting every series to part 1.
+
+`set_read_only()` (used by `--plan`) opens the database with `mode=ro`, so
+nothing is created, migrated or imported on disk; without a database the
+reads see an empty in-memory one (with the legacy JSON imported into it).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+from typing import Dict, Optional
+
+from .util import ensure_dir
+
+LEGACY_JSON_PATH = "state/series.json"
+
+# A claim that is never advanced or released (e.g. the process was killed)
+# expires after this many seconds so the part is eventually retried.
+CLAIM_TTL = float(os.environ.get("STATE_CLAIM_TTL", str(2 * 3600)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    key TEXT PRIMARY KEY,
+    seed TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    next_part INTEGER NOT NULL DEFAULT 1,
+    parts_per_series INTEGER NOT NULL,
+    claimed_part INTEGER,
+    claimed_until REAL
+);
+CREATE TABLE IF NOT EXISTS prefetch (
+    series_key TEXT NOT NULL,
+    part INTEGER NOT NULL,
+    script TEXT NOT NULL,
+    PRIMARY KEY (series_key, part)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    series_key TEXT NOT NULL,
+    part INTEGER NOT NULL,
+    topic TEXT NOT NULL,
+    stages TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    advanced INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    target TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    claimed_until REAL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+-- login tokens live in their own database (sessions.py), out of the cached state
+DROP TABLE IF EXISTS sessions;
+CREATE TABLE IF NOT EXISTS backgrounds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    library TEXT NOT NULL,
+    path TEXT NOT NULL,
+    dhash TEXT NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 0,
+    last_part INTEGER,
+    created_at REAL NOT NULL,
+    last_used_at REAL
+);
+CREATE INDEX IF NOT EXISTS backgrounds_library ON backgrounds (library);
+CREATE TABLE IF NOT EXISTS artifacts (
+    job_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    path TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (job_id, role)
+);
+CREATE INDEX IF NOT EXISTS artifacts_sha256 ON artifacts (sha256);
+"""
+
+_local = threading.local()
+_read_only = False
+_setup_lock = threading.Lock()
+_set_up = set()
+
+
+def db_path() -> str:
+    return os.environ.get("STATE_DB", "state/series.db")
+
+
+def exists() -> bool:
+    return os.path.isfile(db_path())
+
+
+def set_read_only(flag: bool = True) -> None:
+    """Open the database read-only from now on; writes then fail instead of creating it."""
+    global _read_only
+    _read_only = flag
+
+
+def _connect_read_only(path: str, schema: str) -> sqlite3.Connection:
+    if not os.path.isfile(path):
+        conn = sqlite3.connect(":memory:", isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(schema)
+        if schema is _SCHEMA:
+            _import_legacy_json(conn)
+        return conn
+    uri = f"file:{urllib.request.pathname2url(os.path.abspath(path))}?mode=ro"
+    if not os.path.exists(f"{path}-wal"):
+        # no writer is active; without this even a read-only WAL reader creates -wal/-shm files
+        uri += "&immutable=1"
+    conn = sqlite3.connect(uri, uri=True, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def _retry_busy(fn, attempts: int = 5):
+    """Run `fn`, retrying while another connection holds the lock it needs."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn()
+        except sqlite3.OperationalError as e:
+            if attempt == attempts or not ("locked" in str(e) or "busy" in str(e)):
+                raise
+            time.sleep(0.2 * attempt)
+
+
+def _setup(conn: sqlite3.Connection, schema: str) -> None:
+    """Switch the database to WAL, apply `schema` and import the legacy JSON into a new database."""
+    _retry_busy(lambda: conn.execute("PRAGMA journal_mode=WAL"))
+    _retry_busy(lambda: conn.executescript(schema))
+    if schema is not _SCHEMA:
+        return
+
+    def import_once():
+        # user_version marks the import as done, so concurrent processes run it only once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+                if conn.execute("SELECT COUNT(*) FROM series").fetchone()[0] == 0:
+                    _import_legacy_json(conn)
+                conn.execute("PRAGMA user_version = 1")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    _retry_busy(import_once)
+
+
+def connect(path: str = None, schema: str = None) -> sqlite3.Connection:
+    """
+    Per-thread connection to the state database, created on first use. Other
+    modules keep separate databases at `path` with their own `schema`
+    (e.g. the login sessions, see `sessions.py`).
+
+    WAL mode, the schema and the legacy import are set up once per process and
+    database, so threads opening their first connection at the same time do
+    not race each other for the locks they need.
+    """
+    path = path or db_path()
+    schema = schema or _SCHEMA
+    key = f"{path}?mode=ro" if _read_only else path
+    conn = getattr(_local, "conns", {}).get(key)
+    if conn is not None:
+        return conn
+    if _read_only:
+        conn = _connect_read_only(path, schema)
+    else:
+        ensure_dir(os.path.dirname(path) or ".")
+        # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        # first, so every statement below waits for other connections instead of failing
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # freed pages are zeroed, so dropped rows (e.g. old login tokens) do not linger in the file
+        conn.execute("PRAGMA secure_delete=ON")
+        with _setup_lock:
+            if path not in _set_up:
+                _setup(conn, schema)
+                _set_up.add(path)
+    if not hasattr(_local, "conns"):
+        _local.conns = {}
+    _local.conns[key] = conn
+    return conn
+
+
+class transaction:
+    """`with transaction() as conn:` runs the block in one write transaction."""
+
+    def __init__(self, path: str = None, schema: str = None):
+        self.path, self.schema = path, schema
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn = connect(self.path, self.schema)
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def _import_legacy_json(conn: sqlite3.Connection, path: str = LEGACY_JSON_PATH) -> None:
+    if not os.path.isfile(path):
+        return
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+    except Exception as e:
+        print(f"Could not import {path}, leaving it untouched: {e}")
+        return
+    for key, s in legacy.get("series", {}).items():
+        conn.execute(
+            "INSERT OR IGNORE INTO series (key, seed, mode, next_part, parts_per_series) VALUES (?, ?, ?, ?, ?)",
+            (key, s["seed"], s["mode"], int(s["next_part"]), int(s["parts_per_series"])),
+        )
+
+
+def ensure_series(key: str, seed: str, mode: str, parts_per: int) -> None:
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO series (key, seed, mode, parts_per_series) VALUES (?, ?, ?, ?)",
+            (key, seed, mode, parts_per),
+        )
+
+
+def get_series(key: str) -> Optional[Dict]:
+    row = connect().execute("SELECT * FROM series WHERE key = ?", (key,)).fetchone()
+    return dict(row) if row else None
+
+
+def claim_next_part(key: str, ttl: float = None) -> Optional[int]:
+    """
+    Reserve the next part of series `key` for this worker.
+
+    Returns the part number, or None if the series is finished or another
+    worker holds an unexpired claim on it.
+    """
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT next_part, parts_per_series, claimed_until FROM series WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row["next_part"] > row["parts_per_series"]:
+            return None
+        if row["claimed_until"] is not None and row["claimed_until"] > now:
+            return None
+        conn.execute(
+            "UPDATE series SET claimed_part = ?, claimed_until = ? WHERE key = ?",
+            (row["next_part"], now + (CLAIM_TTL if ttl is None else ttl), key),
+        )
+        return row["next_part"]
+
+
+def peek_next_part(key: str) -> Optional[int]:
+    """The part `claim_next_part` would reserve right now, without reserving it."""
+    row = connect().execute(
+        "SELECT next_part, parts_per_series, claimed_until FROM series WHERE key = ?", (key,)
+    ).fetchone()
+    if row is None or row["next_part"] > row["parts_per_series"]:
+        return None
+    if row["claimed_until"] is not None and row["claimed_until"] > time.time():
+        return None
+    return row["next_part"]
+
+
+def advance_series(key: str) -> None:
+    """Mark the claimed part as produced and move on to the next one."""
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE series SET next_part = next_part + 1, claimed_part = NULL, claimed_until = NULL WHERE key = ?",
+            (key,),
+        )
+        # prefetched scripts for parts that are now published are no longer needed
+        conn.execute(
+            "DELETE FROM prefetch WHERE series_key = ? AND part < (SELECT next_part FROM series WHERE key = ?)",
+            (key, key),
+        )
+
+
+def release_series(key: str) -> None:
+    """Drop a claim without advancing, so the part is retried on the next run."""
+    with transaction() as conn:
+        conn.execute("UPDATE series SET claimed_part = NULL, claimed_until = NULL WHERE key = ?", (key,))
+
+
+def store_prefetch(key: str, scripts: Dict[int, str]) -> None:
+    """Keep scripts generated ahead of time for upcoming parts of a series."""
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO prefetch (series_key, part, script) VALUES (?, ?, ?)",
+            [(key, int(part), script) for part, script in scripts.items()],
+        )
+
+
+def get_prefetch(key: str, part: int) -> Optional[str]:
+    row = connect().execute(
+        "SELECT script FROM prefetch WHERE series_key = ? AND part = ?", (key, part)
+    ).fetchone()
+    return row["script"] if row else None
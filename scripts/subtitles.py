@@ -0,0 +1,169 @@
+"""
+subtitles.py
+------------
+
+Cached Pillow subtitle rasterizer (no ImageMagick).
+
+* Fonts are loaded once per (path, size) from a small registry instead of
+  probing the filesystem and reparsing the TrueType file for every sentence.
+* Word widths are cached per font, so wrapping a paragraph is linear in the
+  number of words rather than re-measuring the growing line.
+* Text is drawn once with a Pillow stroke instead of nine offset passes.
+* Rendered captions are kept in an LRU keyed by (text, font, size, style).
+* `render_captions` rasterizes every caption of a script in one batch and
+  returns premultiplied arrays the compositor can blend directly.
+
+`SUBTITLE_CACHE_SIZE` bounds the caption LRU (default 256 bitmaps).
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Common paths on ubuntu-latest runners, in order of preference
+FONT_PATHS = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
+
+class CaptionStyle(NamedTuple):
+    max_width_px: int = 1000
+    font_size: int = 56
+    padding: int = 24
+    bg_alpha: int = 120
+    stroke_width: int = 1
+    fill: Tuple[int, int, int] = (255, 255, 255)
+    stroke_fill: Tuple[int, int, int] = (0, 0, 0)
+    font_path: Optional[str] = None
+
+
+class Caption(NamedTuple):
+    """A rasterized caption in premultiplied form."""
+    premul: np.ndarray  # (h, w, 3) uint16, rgb * alpha
+    inv_alpha: np.ndarray  # (h, w, 1) uint16, 255 - alpha
+
+    @property
+    def width(self) -> int:
+        return self.premul.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.premul.shape[0]
+
+
+@lru_cache(maxsize=None)
+def _find_font_path() -> Optional[str]:
+    for p in FONT_PATHS:
+        if os.path.exists(p):
+            return p
+    return None
+
+
+@lru_cache(maxsize=32)
+def get_font(size: int, path: Optional[str] = None):
+    """Font registry: each (path, size) is parsed once per process."""
+    path = path or _find_font_path()
+    if path:
+        try:
+            return ImageFont.truetype(path, size=size)
+        except Exception:
+            pass
+    # Fallback to default (no TTF, metrics less precise)
+    return ImageFont.load_default()
+
+
+@lru_cache(maxsize=8192)
+def _word_width(font, word: str) -> float:
+    return font.getlength(word)
+
+
+def wrap_text(text: str, font, max_width: int) -> List[str]:
+    """Greedy word wrap using cached per-word widths."""
+    space = _word_width(font, " ")
+    lines = []
+    for paragraph in text.split("\n"):
+        if not paragraph:
+            lines.append("")
+            continue
+        line: List[str] = []
+        line_w = 0.0
+        for w in paragraph.split(" "):
+            if not w:
+                continue
+            ww = _word_width(font, w)
+            test_w = line_w + space + ww if line else ww
+            if test_w <= max_width or not line:
+                line.append(w)
+                line_w = test_w
+            else:
+                lines.append(" ".join(line))
+                line, line_w = [w], ww
+        if line:
+            lines.append(" ".join(line))
+    return lines
+
+
+def rasterize(text: str, style: CaptionStyle = CaptionStyle()) -> np.ndarray:
+    """Return an RGBA array (H, W, 4): outlined text on a semi-transparent box."""
+    font = get_font(style.font_size, style.font_path)
+    lines = wrap_text(text, font, style.max_width_px)
+    pad = style.padding
+
+    ascent, descent = font.getmetrics()
+    line_h = ascent + descent + 6
+    text_h = line_h * max(len(lines), 1)
+    widths = [int(font.getlength(line)) for line in lines]
+    box_w = max(max(widths, default=0), style.max_width_px) + pad * 2
+    h = text_h + pad * 2
+
+    img = Image.new("RGBA", (box_w, h), (0, 0, 0, style.bg_alpha))
+    draw = ImageDraw.Draw(img)
+    y = pad
+    for line, line_w in zip(lines, widths):
+        x = (box_w - line_w) // 2  # center
+        draw.text(
+            (x, y), line, font=font, fill=(*style.fill, 255),
+            stroke_width=style.stroke_width, stroke_fill=(*style.stroke_fill, 255),
+        )
+        y += line_h
+    return np.array(img)
+
+
+def premultiply(rgba: np.ndarray) -> Caption:
+    alpha = rgba[..., 3:4].astype(np.uint16)
+    return Caption(rgba[..., :3].astype(np.uint16) * alpha, 255 - alpha)
+
+
+_cache: "OrderedDict[tuple, Caption]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_size() -> int:
+    return int(os.environ.get("SUBTITLE_CACHE_SIZE", "256"))
+
+
+def render_caption(text: str, style: CaptionStyle = CaptionStyle()) -> Caption:
+    """Rasterize one caption, served from the LRU when possible."""
+    key = (text, style)
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+    caption = premultiply(rasterize(text, style))
+    with _cache_lock:
+        _cache[key] = caption
+        while len(_cache) > _cache_size():
+            _cache.popitem(last=False)
+    return caption
+
+
+def render_captions(texts: Sequence[str], style: CaptionStyle = CaptionStyle()) -> List[Caption]:
+    """Rasterize all captions for a script; repeated lines are drawn once."""
+    return [render_caption(text, style) for text in texts]
@@ -0,0 +1,181 @@
+"""
+trace.py
+--------
+
+Lightweight per-stage tracing for the pipeline. Every stage wrapped in
+`span()` records its duration, retry count, bytes in/out and memory as one
+JSON line in the run log, and `summary_table()` renders an end-of-run
+overview:
+
+    with trace.span("render", topic=title, inputs=[img_path, audio_path]) as sp:
+        video_path, thumb_path = create_video(...)
+        sp.output(video_path, thumb_path)
+
+Code deeper in a stage can call `trace.add_retry()` to count retries on the
+span that is currently open in its thread.
+
+Memory is the change of this process's resident set over the stage
+(`rss_delta_mb`, Linux only; stages running on other threads at the same
+time count too) plus `process_peak_rss_mb`, the high-water mark of the
+whole process so far, which only ever grows and so is no per-stage figure.
+
+Environment variables
+---------------------
+RUN_LOG        Path of the JSON-lines run log (default `logs/run-<timestamp>.jsonl`).
+TRACE_DISABLE  Set to 1 to skip writing the run log (spans are still summarised).
+"""
+
+import contextvars
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from .util import ensure_dir, timestamp
+
+_current: contextvars.ContextVar = contextvars.ContextVar("trace_span", default=None)
+_lock = threading.Lock()
+_records: List[Dict] = []
+_log_path: Optional[str] = None
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux; children covers ffmpeg and render workers
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)
+
+
+def _rss_mb() -> Optional[float]:
+    """Current resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+def _size(paths) -> int:
+    return sum(os.path.getsize(p) for p in paths if isinstance(p, str) and os.path.isfile(p))
+
+
+class Span:
+    def __init__(self, stage: str, attrs: Dict):
+        self.stage = stage
+        self.attrs = attrs
+        self.retries = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def output(self, *paths) -> None:
+        """Count the size of produced files; anything that is not a file is ignored."""
+        self.bytes_out += _size(paths)
+
+
+def log_path() -> Optional[str]:
+    if os.environ.get("TRACE_DISABLE", "").strip().lower() in ("1", "true", "yes"):
+        return None
+    global _log_path
+    if _log_path is None:
+        _log_path = os.environ.get("RUN_LOG") or os.path.join("logs", f"run-{timestamp()}.jsonl")
+    return _log_path
+
+
+def _emit(record: Dict) -> None:
+    path = log_path()
+    with _lock:
+        _records.append(record)
+        if path:
+            ensure_dir(os.path.dirname(path) or ".")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+def event(name: str, **fields) -> None:
+    """Write a free-form record (run start/end, counts) to the run log."""
+    _emit({"event": name, "ts": time.time(), **fields})
+
+
+@contextmanager
+def span(stage: str, inputs=(), **attrs):
+    sp = Span(stage, attrs)
+    sp.bytes_in = _size(inputs)
+    token = _current.set(sp)
+    rss_start = _rss_mb()
+    start = time.time()
+    t0 = time.perf_counter()
+    error = None
+    try:
+        yield sp
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        rss_end = _rss_mb()
+        _emit({
+            "event": "stage",
+            "stage": stage,
+            "ts": start,
+            "duration_s": round(time.perf_counter() - t0, 4),
+            "ok": error is None,
+            "error": error,
+            "retries": sp.retries,
+            "bytes_in": sp.bytes_in,
+            "bytes_out": sp.bytes_out,
+            "rss_delta_mb": None if rss_start is None or rss_end is None else round(rss_end - rss_start, 1),
+            "process_peak_rss_mb": _peak_rss_mb(),
+            **attrs,
+        })
+
+
+def add_retry(n: int = 1) -> None:
+    sp = _current.get()
+    if sp is not None:
+        sp.retries += n
+
+
+def records() -> List[Dict]:
+    with _lock:
+        return list(_records)
+
+
+def reset() -> None:
+    """Forget recorded spans and start a new run log (between daemon runs)."""
+    global _log_path
+    with _lock:
+        _records.clear()
+        _log_path = None
+
+
+def summary_table() -> str:
+    """Per-stage totals of everything traced so far in this process."""
+    stats: Dict[str, Dict] = {}
+    for r in records():
+        if r.get("event") != "stage":
+            continue
+        s = stats.setdefault(r["stage"], {"n": 0, "fail": 0, "total": 0.0, "max": 0.0, "retries": 0, "out": 0,
+                                          "rss": None})
+        s["n"] += 1
+        s["fail"] += 0 if r["ok"] else 1
+        s["total"] += r["duration_s"]
+        s["max"] = max(s["max"], r["duration_s"])
+        s["retries"] += r["retries"]
+        s["out"] += r["bytes_out"]
+        if r.get("rss_delta_mb") is not None:
+            s["rss"] = max(s["rss"] if s["rss"] is not None else r["rss_delta_mb"], r["rss_delta_mb"])
+    header = (f"{'stage':<12}{'calls':>6}{'fail':>6}{'total s':>10}{'mean s':>9}{'max s':>9}{'retries':>9}"
+              f"{'MB out':>9}{'max +RSS MB':>13}")
+    lines = [header, "-" * len(header)]
+    for name, s in stats.items():
+        lines.append(
+            f"{name:<12}{s['n']:>6}{s['fail']:>6}{s['total']:>10.2f}{s['total'] / s['n']:>9.2f}"
+            f"{s['max']:>9.2f}{s['retries']:>9}{s['out'] / 1e6:>9.2f}"
+            f"{'-' if s['rss'] is None else format(s['rss'], '.1f'):>13}"
+        )
+    lines.append(f"process peak RSS {_peak_rss_mb()} MB (high-water mark of this process or its largest child)")
+    return "\n".join(lines)
@@ -9,35 +9,22 @@ are deduplicated and filtered for basic English text. Only the first three topic
 
 import os
 from typing import List, Dict
-from .util import read_json, write_json, ensure_dir, slugify
-
-STATE_PATH = "state/series.json"
-
-def _default_state():
-    return {"series": {}}
-
-def _load_state():
-    return read_json(STATE_PATH, _default_state())
-
-def _save_state(state):
-    write_json(STATE_PATH, state)
+from . import state
 
 def _series_key(seed: str, mode: str) -> str:
     return f"{mode}:{seed.strip()}"
 
-def _init_series(state, seed: str, mode: str, parts_per: int):
-    key = _series_key(seed, mode)
-    if key not in state["series"]:
-        state["series"][key] = {"seed": seed.strip(), "mode": mode, "next_part": 1, "parts_per_series": parts_per}
-    return state
-
-def get_trends() -> List[Dict]:
+def get_trends(claim: bool = True) -> List[Dict]:
     """
     Returnerar “teman” med seriesupport.
     Varje item: {title, url, snippet, meta: {series_key, part}}
+
+    With `claim=False` nothing is written: the parts that would be picked are
+    only looked up (used by `--plan`).
     """
     mode = os.environ.get("CONTENT_MODE", "mixed").strip().lower()
     parts_per = int(os.environ.get("PARTS_PER_SERIES", "8"))
+    per_run = int(os.environ.get("TOPICS_PER_RUN", "3"))
     seeds_env = os.environ.get("SERIES_SEEDS", "")
     seeds = [s for s in (seeds_env.split(",") if seeds_env else []) if s.strip()]
 
@@ -57,18 +44,20 @@ def get_trends() -> List[Dict]:
         else:
             seeds = defaults["voxel_story"][:1] + defaults["spooky_story"][:1] + defaults["funny_texts"][:1]
 
-    state = _load_state()
-    for seed in seeds:
-        state = _init_series(state, seed, mode, parts_per)
-    _save_state(state)
+    if claim:
+        for seed in seeds:
+            state.ensure_series(_series_key(seed, mode), seed.strip(), mode, parts_per)
 
-    # Välj upp till 3 av serierna att producera denna körning
+    # Välj upp till TOPICS_PER_RUN (standard 3) av serierna att producera denna körning.
+    # Delen reserveras atomiskt så att parallella körningar inte tar samma avsnitt.
     picks = []
     for seed in seeds:
         key = _series_key(seed, mode)
-        s = state["series"][key]
-        if s["next_part"] <= s["parts_per_series"]:
-            part = s["next_part"]
+        if claim:
+            part = state.claim_next_part(key)
+        else:
+            part = state.peek_next_part(key) if state.get_series(key) else 1
+        if part is not None:
             title = f"{seed} — Part {part}"
             picks.append({
                 "title": title,
@@ -76,13 +65,13 @@ def get_trends() -> List[Dict]:
                 "snippet": f"{mode} series seed: {seed} (part {part})",
                 "meta": {"series_key": key, "seed": seed, "part": part, "mode": mode}
             })
-        if len(picks) == 3:
+        if len(picks) >= per_run:
             break
 
     return picks
 
 def advance_series(series_key: str):
-    state = _load_state()
-    if series_key in state["series"]:
-        state["series"][series_key]["next_part"] += 1
-        _save_state(state)
+    state.advance_series(series_key)
+
+def release_series(series_key: str):
+    state.release_series(series_key)
@@ -2,14 +2,115 @@
 tts.py
 ------
 
-Generate voice‑overs using OpenAI's text‑to‑speech API. The resulting audio
-file is saved to the `out/` directory in WAV format.
+Generate voice‑overs using OpenAI's text‑to‑speech API. The audio is
+requested in a format an MP4 can carry as is (AAC by default), so the
+renderer muxes it with `-c:a copy` instead of decoding and re-encoding it.
+The file extension follows the bytes actually returned, not the request.
+
+By default every sentence is synthesized as its own request, all in parallel
+(so the call takes as long as the longest sentence, not the whole script).
+The raw PCM clips are joined with optional gaps and encoded once, and the
+exact start/end of every sentence is saved as a timing manifest next to the
+audio (`audio.save_timings`) for the subtitles.
+
+Environment variables
+---------------------
+TTS_FORMAT        `aac` (default), `opus`, `mp3` or `wav`.
+TTS_MODE          `sentences` (default) or `whole` for one request per script.
+TTS_SENTENCE_GAP  Seconds of silence between sentences (default 0).
 """
 
+import contextvars
 import os
-import time
-import openai
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from . import audio, cache, ratelimit, trace
+from .sessions import openai_client
+
+FORMATS = ("aac", "opus", "mp3", "wav")
+# OpenAI's `pcm` response: 24 kHz, 16-bit signed little-endian, mono
+PCM_RATE = 24000
+MAX_PARALLEL = 16
+
+# split after the punctuation, at the same boundaries video.subtitle_segments uses
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def tts_format() -> str:
+    fmt = os.environ.get("TTS_FORMAT", "aac").strip().lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"TTS_FORMAT must be one of {', '.join(FORMATS)}, not {fmt!r}")
+    return fmt
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_RE.split(text.strip()) if s.strip()]
+
+
+def _speech(text: str, voice: str, speed: float, fmt: str, retries: int) -> bytes:
+    key = cache.cache_key("speech", model="tts-1", voice=voice, input=text, speed=speed, response_format=fmt)
+    data = cache.get(key, ".audio")
+    if data is not None:
+        return data
+    response = ratelimit.call("openai", "tts-1", lambda: openai_client().audio.speech.create(
+        model="tts-1",
+        voice=voice,
+        input=text,
+        speed=speed,
+        response_format=fmt,
+    ), attempts=retries)
+    cache.put(key, response.content, ".audio")
+    return response.content
+
+
+def _report(filepath: str, slug: str, sentences: int = 1) -> str:
+    info = audio.probe(filepath)
+    print(f"Narration: {info.codec}, {info.duration:.2f}s, {sentences} request(s)")
+    trace.event("audio", slug=slug, codec=info.codec, duration=round(info.duration, 3), sentences=sentences)
+    return filepath
+
+
+def _generate_whole(text, slug, out_dir, voice, speed, retries) -> str:
+    data = _speech(text, voice, speed, tts_format(), retries)
+    codec = audio.detect_format(data[:64]) or tts_format()
+    filepath = os.path.join(out_dir, f"{slug}{audio.extension(codec)}")
+    # a manifest left by an earlier per-sentence run would no longer match
+    audio.drop_timings(filepath)
+    with open(filepath, "wb") as f:
+        f.write(data)
+    return _report(filepath, slug)
+
+
+def _generate_sentences(sentences, slug, out_dir, voice, speed, retries) -> str:
+    with ThreadPoolExecutor(max_workers=min(len(sentences), MAX_PARALLEL)) as pool:
+        # a context copy per request keeps retries counted on the caller's trace span
+        futures = [
+            pool.submit(contextvars.copy_context().run, _speech, s, voice, speed, "pcm", retries)
+            for s in sentences
+        ]
+        clips = [f.result() for f in futures]
+
+    gap = bytes(2 * round(float(os.environ.get("TTS_SENTENCE_GAP", "0")) * PCM_RATE))
+    parts, timings, offset = [], [], 0
+    for i, (sentence, pcm) in enumerate(zip(sentences, clips)):
+        pcm = pcm[:len(pcm) // 2 * 2]
+        if i:
+            parts.append(gap)
+            offset += len(gap) // 2
+        n = len(pcm) // 2
+        timings.append(audio.Timing(round(offset / PCM_RATE, 3), round((offset + n) / PCM_RATE, 3), sentence))
+        parts.append(pcm)
+        offset += n
 
+    fmt = tts_format()
+    filepath = os.path.join(out_dir, f"{slug}{audio.extension(fmt)}")
+    # the manifest is written only once the narration it describes is complete
+    audio.drop_timings(filepath)
+    audio.encode_pcm(b"".join(parts), PCM_RATE, fmt, filepath)
+    audio.save_timings(filepath, timings)
+    return _report(filepath, slug, len(sentences))
 
 
 def generate_tts(text: str, slug: str, out_dir: str = "out", voice: str = "alloy", speed: float = 1.0, retries: int = 3) -> str:
@@ -29,28 +130,16 @@ def generate_tts(text: str, slug: str, out_dir: str = "out", voice: str = "alloy
     speed : float
         Playback speed. 1.0 is normal speed.
     retries : int
-        Number of times to retry generation on failure.
+        Attempts before giving up on throttling or transient errors (see `ratelimit.py`).
 
     Returns
     -------
     str
-        Path to the saved WAV file.
+        Path to the saved audio file (`.aac`, `.opus`, ...). In sentence mode
+        a timing manifest is written alongside (see `audio.load_timings`).
     """
     os.makedirs(out_dir, exist_ok=True)
-    for attempt in range(retries):
-        try:
-            response = openai.audio.speech.create(
-                model="tts-1",
-                voice=voice,
-                input=text,
-                speed=speed,
-            )
-            filepath = os.path.join(out_dir, f"{slug}.wav")
-            with open(filepath, "wb") as f:
-                f.write(response.content)
-            return filepath
-        except Exception:
-            if attempt < retries - 1:
-                time.sleep(2 ** attempt)
-                continue
-            raise
+    sentences = split_sentences(text)
+    if os.environ.get("TTS_MODE", "sentences").strip().lower() == "whole" or len(sentences) < 2:
+        return _generate_whole(text, slug, out_dir, voice, speed, retries)
+    return _generate_sentences(sentences, slug, out_dir, voice, speed, retries)
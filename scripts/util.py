@@ -17,6 +17,16 @@ def safe_filename(name: str) -> str:
 def timestamp() -> str:
     return time.strftime("%Y%m%d-%H%M%S")
 
+def process_context():
+    """
+    Start method for worker process pools. Pools start their workers lazily,
+    while HTTP, SQLite and outbox threads are running, and forking a
+    multi-threaded process can deadlock the child; a fork server avoids that.
+    """
+    import multiprocessing
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
 def ensure_dir(path: str):
     Path(path).mkdir(parents=True, exist_ok=True)
 
@@ -28,9 +38,14 @@ def read_json(path: str, default):
         return default
 
 def write_json(path: str, data):
+    # write to a sibling temp file and rename, so readers never see a partial file
     ensure_dir(os.path.dirname(path) or ".")
-    with open(path, "w", encoding="utf-8") as f:
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
 
 
 
@@ -2,17 +2,20 @@
 video.py
 --------
 
-Assemble image, audio and (Pillow-rendered) subtitles into a vertical video using MoviePy.
+Assemble image, audio and (Pillow-rendered) subtitles into a vertical video.
 Avoids ImageMagick/TextClip entirely to bypass policy issues on CI runners.
+
+`RENDER_ENGINE` selects the renderer: `ffmpeg` (default, NumPy frames piped
+straight into ffmpeg, see `render.py`) or `moviepy`. If the ffmpeg renderer
+fails the MoviePy path is used as a fallback. MoviePy is only imported when
+that path actually runs.
 """
 
 import os
 import re
-import textwrap
-import numpy as np
 
 # Pillow imports
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 
 # Pillow 10 removed ANTIALIAS; alias it to LANCZOS if missing
 try:
@@ -20,49 +23,14 @@ try:
 except AttributeError:
     Image.ANTIALIAS = Image.Resampling.LANCZOS  # type: ignore[attr-defined]
 
-from moviepy.editor import (
-    ImageClip,
-    AudioFileClip,
-    CompositeVideoClip,
-    vfx,
-)
+from . import assets, audio, encode
+from .subtitles import CaptionStyle, rasterize, render_captions
+from .zoom import KenBurns
 
 # -------- Pillow subtitle rendering (no ImageMagick) --------
 
-def _load_font(preferred=("DejaVuSans-Bold.ttf", "DejaVuSans.ttf"), size=48):
-    # Common path on ubuntu-latest runners
-    search_paths = [
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-    ]
-    for p in search_paths:
-        if os.path.exists(p):
-            try:
-                return ImageFont.truetype(p, size=size)
-            except Exception:
-                pass
-    # Fallback to default (no TTF, metrics less precise)
-    return ImageFont.load_default()
-
-def _wrap_text_to_width(draw: ImageDraw.ImageDraw, text: str, font, max_width: int):
-    lines = []
-    for paragraph in text.split("\n"):
-        if not paragraph:
-            lines.append("")
-            continue
-        words = paragraph.split(" ")
-        line = ""
-        for w in words:
-            test = (line + " " + w).strip()
-            if draw.textlength(test, font=font) <= max_width:
-                line = test
-            else:
-                if line:
-                    lines.append(line)
-                line = w
-        if line:
-            lines.append(line)
-    return lines
+SUBTITLE_STYLE = CaptionStyle(max_width_px=1000, font_size=56, padding=24, bg_alpha=120)
+
 
 def render_subtitle_rgba(
     text: str,
@@ -72,41 +40,45 @@ def render_subtitle_rgba(
     bg_alpha: int = 140,
 ):
     """Return RGBA numpy array (H, W, 4) with outlined white text on semi-transparent box."""
-    font = _load_font(size=font_size)
-    # temp image for measurement
-    tmp_img = Image.new("RGB", (max_width_px, 10))
-    draw = ImageDraw.Draw(tmp_img)
-    lines = _wrap_text_to_width(draw, text, font, max_width_px)
-
-    # Measure height
-    ascent, descent = font.getmetrics()
-    line_h = ascent + descent + 6
-    text_h = line_h * max(len(lines), 1)
-    text_w = max((int(draw.textlength(line, font=font)) for line in lines), default=0)
-    w = max(text_w + padding * 2, max_width_px + padding * 2)
-    h = text_h + padding * 2
-
-    # Create RGBA canvas
-    img = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(img)
-
-    # Background semi-transparent box
-    box_w = max(text_w + padding * 2, max_width_px + padding * 2)
-    draw.rectangle([0, 0, box_w, h], fill=(0, 0, 0, bg_alpha))
-
-    # Draw outlined text (black stroke)
-    y = padding
-    for line in lines:
-        line_w = int(draw.textlength(line, font=font))
-        x = (box_w - line_w) // 2  # center
-        # stroke
-        for dx, dy in [(-1,0),(1,0),(0,-1),(0,1),(-1,-1),(1,-1),(-1,1),(1,1)]:
-            draw.text((x+dx, y+dy), line, font=font, fill=(0,0,0,255))
-        # fill
-        draw.text((x, y), line, font=font, fill=(255,255,255,255))
-        y += line_h
-
-    return np.array(img)  # (H, W, 4)
+    return rasterize(text, CaptionStyle(max_width_px, font_size, padding, bg_alpha))
+
+# -------- Subtitle timing --------
+
+SUBTITLE_Y = int(1920 * 0.8)
+
+
+def subtitle_segments(script: str, duration: float, timings=None):
+    """
+    Split the script into sentences. With a timing manifest from per-sentence
+    TTS (`audio.load_timings`) each one is shown exactly while it is spoken;
+    otherwise each gets an equal share of `duration`.
+    """
+    sentences = [s.strip() for s in re.split(r"[.!?]\s+", script) if s.strip()]
+    if timings and len(timings) == len(sentences):
+        # hold each caption until the next sentence starts, so gaps do not blink
+        ends = [t.start for t in timings[1:]] + [max(duration, timings[-1].end)]
+        return [
+            (t.start, end, sentence)
+            for t, end, sentence in zip(timings, ends, sentences)
+            if t.start < duration
+        ]
+    num_segments = max(len(sentences), 1)
+    return [
+        ((i / num_segments) * duration, ((i + 1) / num_segments) * duration, sentence)
+        for i, sentence in enumerate(sentences)
+    ]
+
+
+def subtitle_overlays(script: str, duration: float, timings=None):
+    """Subtitle bitmaps positioned for the ffmpeg renderer."""
+    from .render import WIDTH, overlay_from_caption
+
+    segments = subtitle_segments(script, duration, timings)
+    captions = render_captions([sentence for _, _, sentence in segments], SUBTITLE_STYLE)
+    return [
+        overlay_from_caption(caption, start, end, (WIDTH - caption.width) // 2, SUBTITLE_Y)
+        for (start, end, _), caption in zip(segments, captions)
+    ]
 
 # -------- Main video assembly --------
 
@@ -117,34 +89,47 @@ def create_video(
     slug: str,
     out_dir: str = "out",
 ) -> tuple[str, str]:
-    os.makedirs(out_dir, exist_ok=True)
+    engine = os.environ.get("RENDER_ENGINE", "ffmpeg").strip().lower()
+    if engine == "ffmpeg":
+        from .render import render_video_ffmpeg
+        try:
+            return render_video_ffmpeg(image_path, audio_path, script, slug, out_dir)
+        except Exception as e:
+            print(f"ffmpeg renderer failed, falling back to MoviePy: {e}")
+    return _create_video_moviepy(image_path, audio_path, script, slug, out_dir)
 
-    # Base background (1080x1920)
-    bg_clip = ImageClip(image_path).resize(height=1920).fx(vfx.crop, width=1080, height=1920, x_center=540, y_center=960)
-    # subtle zoom
-    bg_clip = bg_clip.fx(vfx.resize, lambda t: 1.04 + 0.02 * t)
+
+def _create_video_moviepy(
+    image_path: str,
+    audio_path: str,
+    script: str,
+    slug: str,
+    out_dir: str = "out",
+) -> tuple[str, str]:
+    # slow to import (imageio, IPython probing); only needed on this path
+    from moviepy.editor import ImageClip, VideoClip, AudioFileClip, CompositeVideoClip
+
+    os.makedirs(out_dir, exist_ok=True)
 
     # Audio
     narration = AudioFileClip(audio_path)
-    duration = min(29.5, narration.duration)  # ≤ 30s
+    # ffmpeg only estimates the length of raw ADTS streams; the frame headers are exact
+    duration = assets.render_duration(audio_path)  # ≤ 30s
     narration = narration.subclip(0, duration)
 
-    # Split script into sentences
-    sentences = [s.strip() for s in re.split(r"[.!?]\s+", script) if s.strip()]
-    num_segments = max(len(sentences), 1)
+    # Base background (1080x1920) with subtle zoom
+    zoom = KenBurns.from_env(assets.background(image_path, duration), duration)
+    bg_clip = VideoClip(zoom.frame, duration=duration)
 
     # Build subtitle overlay clips (Pillow → ImageClip with mask)
     subtitle_clips = []
-    for i, sentence in enumerate(sentences):
-        start = (i / num_segments) * duration
-        end = ((i + 1) / num_segments) * duration
-
-        rgba = render_subtitle_rgba(sentence, max_width_px=1000, font_size=56, padding=24, bg_alpha=120)
+    for start, end, sentence in subtitle_segments(script, duration, audio.load_timings(audio_path)):
+        rgba = rasterize(sentence, SUBTITLE_STYLE)
         rgb = rgba[..., :3]
         alpha = (rgba[..., 3] / 255.0)
 
-        txt_rgb = ImageClip(rgb).set_start(start).set_end(end).set_position(("center", int(1920 * 0.8)))
-        txt_mask = ImageClip(alpha, ismask=True).set_start(start).set_end(end).set_position(("center", int(1920 * 0.8)))
+        txt_rgb = ImageClip(rgb).set_start(start).set_end(end).set_position(("center", SUBTITLE_Y))
+        txt_mask = ImageClip(alpha, ismask=True).set_start(start).set_end(end).set_position(("center", SUBTITLE_Y))
         txt_rgb = txt_rgb.set_mask(txt_mask)
         subtitle_clips.append(txt_rgb)
 
@@ -154,7 +139,7 @@ def create_video(
 
     # Export video & thumbnail
     video_path = os.path.join(out_dir, f"{slug}.mp4")
-    thumb_path = os.path.join(out_dir, f"{slug}_thumb.jpg")
+    thumb_path = os.path.join(out_dir, f"{slug}_thumb{encode.extension('archive')}")
 
     final.write_videofile(
         video_path,
@@ -167,10 +152,35 @@ def create_video(
         logger=None,
     )
 
-    # Thumbnail from first frame
-    frame = final.get_frame(0)
-    Image.fromarray(frame).save(thumb_path, "JPEG", quality=92)
+    # Thumbnail from the chosen frame
+    from .render import preview_path, preview_size, thumbnail_index
+    frame = final.get_frame(thumbnail_index(duration) / 30)
+    encode.encode_file(frame, "archive", thumb_path)
 
     final.close()
     narration.close()
+
+    # MoviePy cannot fan out; scale the finished video instead of compositing again
+    size = preview_size()
+    if size:
+        from .ffmpeg import run_ffmpeg
+        run_ffmpeg([
+            "-i", video_path, "-vf", f"scale={size[0]}:{size[1]}", "-c:a", "copy",
+            "-c:v", "libx264", "-preset", "veryfast",
+            "-b:v", os.environ.get("RENDER_PREVIEW_BITRATE", "800k"), "-movflags", "+faststart",
+            preview_path(video_path),
+        ])
     return video_path, thumb_path
+
+
+def extract_thumbnail(video_path: str, thumb_path: str) -> str:
+    """Write the THUMBNAIL_AT frame (default: the first) of an existing video as the thumbnail."""
+    from .ffmpeg import run_ffmpeg
+
+    at = float(os.environ.get("THUMBNAIL_AT", "0"))
+    frame_path = f"{thumb_path}.frame.png"
+    run_ffmpeg(["-ss", f"{at:.3f}", "-i", video_path, "-frames:v", "1", frame_path])
+    try:
+        return encode.encode_file(frame_path, "archive", thumb_path)
+    finally:
+        os.remove(frame_path)
@@ -7,17 +7,168 @@ required environment variables (`YT_CLIENT_ID`, `YT_CLIENT_SECRET` and
 `YT_REFRESH_TOKEN`) are missing, the upload step is skipped and the
 function returns the string "skipped". Errors during upload are logged but
 do not halt the main pipeline.
+
+Uploads are sent in chunks through a resumable upload session. Failed chunks
+are retried with the backoff policy from `ratelimit.py`, and the session URI
+is saved under `state/uploads/` so a later run (e.g. `python -m scripts.main
+--resume`) continues mid-file instead of sending the whole video again.
+The OAuth token and the API client are reused across uploads and runs (see
+`sessions.py`).
+
+Environment variables
+---------------------
+YT_CHUNK_SIZE_MB     Upload chunk size in MB, rounded to a multiple of 256 KB (default 8).
+YT_UPLOAD_RETRIES    Retries per chunk on transient errors (default 8).
+YT_UPLOAD_DIR        Where session URIs are kept (default `state/uploads`).
+YT_API_ENDPOINT      Override the API root, e.g. a local fake upload server.
+YT_TOKEN_URI         Override the OAuth token endpoint.
 """
 
+import hashlib
 import os
-from typing import List, Optional
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+import time
+import urllib.parse
+from typing import Callable, List, Optional
+
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
 
+from . import ratelimit, sessions, trace
+from .util import read_json, write_json
+
+# resumable sessions live for about a week on YouTube's side
+SESSION_MAX_AGE = 6 * 24 * 3600
+_CHUNK_UNIT = 256 * 1024
+
+
+def _chunk_size() -> int:
+    mb = float(os.environ.get("YT_CHUNK_SIZE_MB", "8"))
+    return max(1, round(mb * 1024 * 1024 / _CHUNK_UNIT)) * _CHUNK_UNIT
+
+
+def _session_path(video_path: str) -> str:
+    # keyed by content, so the session survives a different checkout path on CI
+    h = hashlib.sha256()
+    with open(video_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    upload_dir = os.environ.get("YT_UPLOAD_DIR", os.path.join("state", "uploads"))
+    return os.path.join(upload_dir, f"{h.hexdigest()[:32]}.json")
+
+
+def _load_session(path: str) -> Optional[str]:
+    session = read_json(path, None)
+    if not session or time.time() - session.get("created", 0) > SESSION_MAX_AGE:
+        return None
+    return session.get("uri")
+
+
+def _print_progress(sent: int, total: int) -> None:
+    print(f"YouTube upload {sent / total:.0%} ({sent // 1024 // 1024}/{total // 1024 // 1024} MB)")
+
+
+def _restart(request) -> None:
+    request.resumable_uri = None
+    request.resumable_progress = 0
+
+
+def _query_progress(request):
+    """
+    Ask the server how much of the session at `request.resumable_uri` it has
+    and continue from there. Returns the API response if the upload had
+    already completed, otherwise None.
+    """
+    headers = {"Content-Range": f"bytes */{request.resumable.size()}", "Content-Length": "0"}
+    resp, content = request.http.request(request.resumable_uri, "PUT", headers=headers)
+    if resp.status in (200, 201):
+        return request.postproc(resp, content)
+    if resp.status != 308:
+        raise HttpError(resp, content, uri=request.resumable_uri)
+    # "Range: bytes=0-<last byte received>", absent if nothing arrived yet
+    received = resp.get("range")
+    request.resumable_progress = int(received.split("-")[1]) + 1 if received else 0
+    return None
+
+
+def resumable_upload(request, session_path: str, progress: Callable[[int, int], None] = _print_progress,
+                     max_retries: int = None):
+    """
+    Drive a resumable `HttpRequest` to completion chunk by chunk and return
+    the API response.
+
+    A session URI saved at `session_path` by an earlier attempt is resumed:
+    the server is asked how many bytes it already has and the upload continues
+    from there. An expired session starts over. Retryable statuses and
+    transport errors back off with the shared policy in `ratelimit.py`
+    (exponential with jitter, honouring Retry-After); anything else is raised.
+    """
+    if max_retries is None:
+        max_retries = int(os.environ.get("YT_UPLOAD_RETRIES", "8"))
+    uri = _load_session(session_path)
+    query = bool(uri)
+    if uri:
+        print(f"Resuming YouTube upload session from {session_path}")
+        request.resumable_uri = uri
+    total = request.resumable.size()
+    saved_uri = uri
+    retries = 0
+    response = None
+    while response is None:
+        try:
+            if query:
+                response = _query_progress(request)
+                query = False
+                continue
+            status, response = request.next_chunk()
+            retries = 0
+            if status and progress:
+                progress(status.resumable_progress, total)
+        except HttpError as e:
+            status_code = e.resp.status
+            if request.resumable_uri and status_code in (404, 410):
+                print(f"YouTube upload session expired ({status_code}), starting over")
+                _restart(request)
+                query = False
+                continue
+            if not ratelimit.is_retryable(e) or retries >= max_retries:
+                raise
+            retries += 1
+            _backoff(retries, e, f"HTTP {status_code}")
+        except Exception as e:
+            if not ratelimit.is_retryable(e) or retries >= max_retries:
+                raise
+            retries += 1
+            _backoff(retries, e, type(e).__name__)
+        finally:
+            if request.resumable_uri and request.resumable_uri != saved_uri:
+                write_json(session_path, {"uri": request.resumable_uri, "created": time.time()})
+                saved_uri = request.resumable_uri
+    if progress:
+        progress(total, total)
+    if os.path.exists(session_path):
+        os.remove(session_path)
+    return response
+
+
+def _backoff(attempt: int, e: Exception, reason: str) -> None:
+    delay = ratelimit.backoff_delay(attempt, e)
+    print(f"YouTube upload chunk failed ({reason}), retry {attempt} in {delay:.1f}s")
+    trace.add_retry()
+    time.sleep(delay)
+
+
+def _insert_request(youtube, body, media):
+    request = youtube.videos().insert(part="snippet,status", body=body, media_body=media)
+    endpoint = os.environ.get("YT_API_ENDPOINT")
+    if endpoint:
+        # the discovery document hard-codes an https upload URL; only its host follows api_endpoint
+        url = urllib.parse.urlsplit(request.uri)
+        request.uri = urllib.parse.urljoin(endpoint, f"{url.path}?{url.query}")
+    return request
+
 
-def upload_youtube(video_path: str, title: str, description: str, tags: List[str]) -> Optional[dict]:
+def upload_youtube(video_path: str, title: str, description: str, tags: List[str],
+                   progress: Callable[[int, int], None] = _print_progress) -> Optional[dict]:
     """
     Upload a video to YouTube as a public Short.
 
@@ -31,6 +182,8 @@ def upload_youtube(video_path: str, title: str, description: str, tags: List[str
         Video description.
     tags : list of str
         List of hashtags or keywords.
+    progress : callable, optional
+        Called with (bytes_sent, total_bytes) after every chunk.
 
     Returns
     -------
@@ -43,17 +196,12 @@ def upload_youtube(video_path: str, title: str, description: str, tags: List[str
     if not (client_id and client_secret and refresh_token):
         print("Skipping YouTube upload, saved to out/")
         return "skipped"
-    creds = Credentials(
-        None,
-        refresh_token=refresh_token,
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=client_id,
-        client_secret=client_secret,
-        scopes=["https://www.googleapis.com/auth/youtube.upload"],
-    )
     try:
-        creds.refresh(Request())
-        youtube = build("youtube", "v3", credentials=creds)
+        creds = sessions.youtube_credentials(
+            client_id, client_secret, refresh_token,
+            os.environ.get("YT_TOKEN_URI", "https://oauth2.googleapis.com/token"),
+        )
+        youtube = sessions.youtube_service(creds, os.environ.get("YT_API_ENDPOINT"))
         body = {
             "snippet": {
                 "title": title,
@@ -66,10 +214,10 @@ def upload_youtube(video_path: str, title: str, description: str, tags: List[str
                 "selfDeclaredMadeForKids": False,
             },
         }
-        media = MediaFileUpload(video_path, chunksize=-1, resumable=True, mimetype="video/mp4")
-        request = youtube.videos().insert(part="snippet,status", body=body, media_body=media)
-        response = request.execute()
-        return response
+        media = MediaFileUpload(video_path, chunksize=_chunk_size(), resumable=True, mimetype="video/mp4")
+        request = _insert_request(youtube, body, media)
+        with ratelimit.slot("youtube", "upload"):
+            return resumable_upload(request, _session_path(video_path), progress)
     except Exception as e:
         print(f"YouTube upload error: {e}")
         return None
@@ -0,0 +1,148 @@
+"""
+zoom.py
+-------
+
+Ken Burns zoom/pan engine for the background clip. The source is upscaled
+once, with a high-quality filter, to the largest zoom the motion needs (times
+an oversampling factor); every frame is then a cheap affine crop of that
+master resampled down to the output size, instead of a full LANCZOS resize of
+the background per frame. With the default 2x oversampling a nearest-neighbour
+pick from the band-limited master stays within a quarter pixel of the exact
+position, which is closer to the old per-frame LANCZOS output than a bilinear
+filter and several times cheaper.
+
+The motion curve is configurable through the environment:
+
+KEN_BURNS_ZOOM_START  Zoom factor at t=0 (default 1.04).
+KEN_BURNS_ZOOM_RATE   Zoom increase per second (default 0.02), used when
+                      KEN_BURNS_ZOOM_END is not set.
+KEN_BURNS_ZOOM_END    Zoom factor at the end of the clip.
+KEN_BURNS_PAN         Anchor movement "x0,y0:x1,y1" in 0..1 frame units
+                      (default "0,0:0,0", i.e. zoom into the top-left corner
+                      exactly like the original MoviePy composite).
+KEN_BURNS_EASING      linear | ease_in | ease_out | ease_in_out (default linear).
+KEN_BURNS_OVERSAMPLE  Master resolution relative to the max zoom (default 2;
+                      1 uses a bilinear resample and a quarter of the memory).
+
+The master can also be prepared ahead of time (`assets.py`) and passed in as
+an (H, W, 4) RGBX array, typically memory-mapped; it is then used in place.
+"""
+
+import math
+import os
+from typing import Tuple
+
+import numpy as np
+from PIL import Image
+
+WIDTH, HEIGHT = 1080, 1920
+
+EASINGS = {
+    "linear": lambda p: p,
+    "ease_in": lambda p: p * p,
+    "ease_out": lambda p: 1 - (1 - p) * (1 - p),
+    "ease_in_out": lambda p: p * p * (3 - 2 * p),
+}
+
+
+def load_background(image_path: str, size: Tuple[int, int] = (WIDTH, HEIGHT)) -> Image.Image:
+    """Scale to cover `size` and crop the same region the MoviePy path uses."""
+    w, h = size
+    img = Image.open(image_path).convert("RGB")
+    scale = max(h / img.height, w / img.width)
+    img = img.resize((round(img.width * scale), round(img.height * scale)), Image.LANCZOS)
+    return img.crop((0, 0, w, h))
+
+
+def _env_zoom(duration: float) -> Tuple[float, float]:
+    zoom_start = float(os.environ.get("KEN_BURNS_ZOOM_START", "1.04"))
+    rate = float(os.environ.get("KEN_BURNS_ZOOM_RATE", "0.02"))
+    zoom_end = float(os.environ.get("KEN_BURNS_ZOOM_END") or zoom_start + rate * duration)
+    return zoom_start, zoom_end
+
+
+def master_shape(duration: float, size: Tuple[int, int] = (WIDTH, HEIGHT)) -> Tuple[int, int]:
+    """(height, width) of the master `KenBurns.from_env` builds for a clip of `duration`."""
+    zoom_start, zoom_end = _env_zoom(duration)
+    oversample = float(os.environ.get("KEN_BURNS_OVERSAMPLE", "2"))
+    scale = max(zoom_start, zoom_end, 1.0) * max(oversample, 1.0)
+    return math.ceil(size[1] * scale), math.ceil(size[0] * scale)
+
+
+def _parse_pan(value: str):
+    start, _, end = value.partition(":")
+    x0, y0 = (float(v) for v in start.split(","))
+    x1, y1 = (float(v) for v in (end or start).split(","))
+    return (x0, y0), (x1, y1)
+
+
+class KenBurns:
+    """
+    Zoom/pan motion over a background image of exactly `size`.
+
+    `zoom_end` defaults to the original linear curve `1.04 + 0.02 * t`
+    evaluated at `duration`. Pan anchors are fractions of the overflow: (0, 0)
+    keeps the top-left corner fixed, (0.5, 0.5) zooms into the centre.
+    """
+
+    def __init__(
+        self,
+        image,
+        duration: float,
+        zoom_start: float = 1.04,
+        zoom_end: float = None,
+        pan_from: Tuple[float, float] = (0.0, 0.0),
+        pan_to: Tuple[float, float] = (0.0, 0.0),
+        easing: str = "linear",
+        size: Tuple[int, int] = (WIDTH, HEIGHT),
+        oversample: float = 2.0,
+    ):
+        self.size = size
+        self.duration = max(duration, 1e-6)
+        self.zoom_start = zoom_start
+        self.zoom_end = zoom_start + 0.02 * duration if zoom_end is None else zoom_end
+        self.pan_from = pan_from
+        self.pan_to = pan_to
+        self.ease = EASINGS[easing]
+        # Upscale once to the largest zoom on the curve
+        self.max_zoom = max(self.zoom_start, self.zoom_end, 1.0)
+        self.scale = self.max_zoom * max(oversample, 1.0)
+        self.resample = Image.NEAREST if oversample >= 2 else Image.BILINEAR
+        w, h = size
+        if isinstance(image, np.ndarray):
+            # prepared master: wrap the (memory-mapped) pixels without copying them
+            mh, mw = image.shape[:2]
+            if mw != math.ceil(w * self.scale):
+                # prepared for another motion curve; box() works in its own scale
+                self.scale = mw / w
+            self.master = Image.frombuffer("RGBX", (mw, mh), image, "raw", "RGBX", 0, 1)
+        else:
+            self.master = image.resize(
+                (math.ceil(w * self.scale), math.ceil(h * self.scale)), Image.LANCZOS
+            )
+
+    @classmethod
+    def from_env(cls, image, duration: float, size: Tuple[int, int] = (WIDTH, HEIGHT)):
+        zoom_start, zoom_end = _env_zoom(duration)
+        pan_from, pan_to = _parse_pan(os.environ.get("KEN_BURNS_PAN", "0,0:0,0"))
+        easing = os.environ.get("KEN_BURNS_EASING", "linear").strip().lower()
+        oversample = float(os.environ.get("KEN_BURNS_OVERSAMPLE", "2"))
+        return cls(image, duration, zoom_start, zoom_end, pan_from, pan_to, easing, size, oversample)
+
+    def box(self, t: float) -> Tuple[float, float, float, float]:
+        """Crop box in master coordinates for the frame at time `t`."""
+        p = self.ease(min(max(t / self.duration, 0.0), 1.0))
+        zoom = self.zoom_start + (self.zoom_end - self.zoom_start) * p
+        ax = self.pan_from[0] + (self.pan_to[0] - self.pan_from[0]) * p
+        ay = self.pan_from[1] + (self.pan_to[1] - self.pan_from[1]) * p
+        w, h = self.size
+        # The visible window of the image zoomed by `zoom`, mapped onto the master
+        bw, bh = w * self.scale / zoom, h * self.scale / zoom
+        x0 = ax * (self.master.width - bw)
+        y0 = ay * (self.master.height - bh)
+        return (x0, y0, x0 + bw, y0 + bh)
+
+    def frame(self, t: float) -> np.ndarray:
+        """(H, W, 3) uint8 background frame at time `t`."""
+        frame = np.asarray(self.master.resize(self.size, self.resample, box=self.box(t)))
+        return frame[..., :3] if frame.shape[2] == 4 else frame
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import state  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run every test in an empty directory with its own state database and artifact store."""
+    monkeypatch.chdir(tmp_path)
+    # absolute paths: connections are cached per thread and path
+    monkeypatch.setenv("STATE_DB", str(tmp_path / "state" / "series.db"))
+    monkeypatch.setenv("SESSIONS_DB", str(tmp_path / "state" / "sessions.db"))
+    monkeypatch.setenv("ARTIFACT_DIR", str(tmp_path / "state" / "artifacts"))
+    monkeypatch.setenv("TRACE_DISABLE", "1")
+    state.set_read_only(False)
+    yield tmp_path
+    state.set_read_only(False)
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from scripts import artifacts, jobs, state
+
+
+def _job(series: str, part: int, status: str = "done") -> str:
+    job = jobs.open_job({"title": f"{series} {part}", "meta": {"series_key": series, "part": part}})
+    with state.transaction() as conn:
+        conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (status, part, job["id"]))
+    return job["id"]
+
+
+def _write(path: str, data: bytes) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _produce(jid: str, name: str, data: bytes) -> str:
+    path = _write(f"out/{name}.mp4", data)
+    artifacts.record(jid, "render", {"video": path})
+    return path
+
+
+def test_record_links_the_output_to_its_blob():
+    jid = _job("s", 1)
+    path = _produce(jid, "s1", b"video bytes")
+    digest = artifacts.file_hash(path)
+    blob = artifacts.find_blob(digest)
+    assert blob == artifacts.blob_path(digest, ".mp4")
+    assert os.path.samefile(path, blob)
+    assert artifacts.job_artifacts(jid)["video"]["sha256"] == digest
+
+
+def test_identical_content_is_stored_once():
+    a = _produce(_job("s", 1), "a", b"same")
+    b = _produce(_job("s", 2), "b", b"same")
+    assert os.path.samefile(a, b)
+    assert artifacts.stored_bytes() == len(b"same")
+
+
+def test_restore_relinks_missing_outputs():
+    jid = _job("s", 1, "pending")
+    path = _produce(jid, "s1", b"video bytes")
+    os.remove(path)
+    assert artifacts.restore(jid) == 1
+    with open(path, "rb") as f:
+        assert f.read() == b"video bytes"
+    assert artifacts.restore(jid) == 0
+
+
+def test_detach_unlinks_before_a_rerun_overwrites():
+    jid = _job("s", 1, "pending")
+    path = _produce(jid, "s1", b"old render")
+    blob = artifacts.find_blob(artifacts.file_hash(path))
+    artifacts.detach(jid, "render")
+    assert not os.path.exists(path)
+    _write(path, b"new render")
+    with open(blob, "rb") as f:
+        assert f.read() == b"old render"
+
+
+def test_retention_keeps_the_newest_finished_parts(monkeypatch):
+    monkeypatch.setenv("ARTIFACT_MAX_MB", "0")
+    ids = [_job("s", part) for part in (1, 2, 3)]
+    unfinished = _job("s", 4, "pending")
+    for jid in ids + [unfinished]:
+        _produce(jid, jid.replace("#", "_"), jid.encode())
+    # part 4 counts towards the newest two but is never dropped itself
+    assert sorted(artifacts.expired_jobs(keep=2)) == ids[:2]
+    assert artifacts.expired_jobs(keep=0) == []
+
+
+def test_size_bound_drops_oldest_finished_jobs_first():
+    ids = [_job("s", part) for part in (1, 2, 3)]
+    for jid in ids:
+        _produce(jid, jid.replace("#", "_"), jid.encode() * 100)
+    assert artifacts.expired_jobs(keep=0, max_bytes=2 * 300) == ids[:1]
+
+
+def test_collect_removes_expired_jobs_and_unreferenced_blobs(monkeypatch):
+    monkeypatch.setattr(artifacts, "_GC_GRACE", -60)
+    old, new = _job("s", 1), _job("s", 2)
+    old_path = _produce(old, "s1", b"old")
+    new_path = _produce(new, "s2", b"new")
+    old_blob = artifacts.find_blob(artifacts.file_hash(old_path))
+    monkeypatch.setenv("ARTIFACT_KEEP_PER_SERIES", "1")
+
+    dry = artifacts.collect(dry_run=True)
+    assert dry.jobs == [old] and os.path.exists(old_path)
+
+    removed = artifacts.collect()
+    assert removed.jobs == [old] and removed.blobs == 1
+    assert not os.path.exists(old_path) and not os.path.exists(old_blob)
+    assert os.path.exists(new_path) and artifacts.job_artifacts(old) == {}
+
+
+@pytest.mark.parametrize("value", ["", "2000"])
+def test_unset_limits_fall_back_to_defaults(monkeypatch, value):
+    monkeypatch.setenv("ARTIFACT_MAX_MB", value)
+    monkeypatch.setenv("ARTIFACT_KEEP_PER_SERIES", value and "5")
+    assert artifacts.expired_jobs() == []
@@ -0,0 +1,92 @@
+import struct
+import wave
+
+import pytest
+
+from scripts import audio
+
+
+def _adts_frame(rate_index: int, payload: int = 32, blocks: int = 1) -> bytes:
+    length = 7 + payload
+    header = bytes([
+        0xFF, 0xF1,
+        (1 << 6) | (rate_index << 2),  # AAC LC, sample rate index, mono (high bit)
+        (1 << 6) | (length >> 11),  # mono (low bits), frame length bits 12-11
+        (length >> 3) & 0xFF,
+        ((length & 0x07) << 5) | 0x1F,
+        0xFC | (blocks - 1),
+    ])
+    return header + bytes(payload)
+
+
+def _ogg_page(granule: int, body: bytes = b"") -> bytes:
+    return b"OggS" + b"\x00\x00" + struct.pack("<q", granule) + bytes(14) + body
+
+
+def _opus(seconds: float, pre_skip: int = 312) -> bytes:
+    head = b"OpusHead" + bytes([1, 1]) + struct.pack("<H", pre_skip) + struct.pack("<I", 48000) + bytes(3)
+    return _ogg_page(0, head) + _ogg_page(0, b"OpusTags") + _ogg_page(pre_skip + round(seconds * 48000))
+
+
+def test_detect_format():
+    assert audio.detect_format(b"RIFF\x00\x00\x00\x00WAVEfmt ") == "wav"
+    assert audio.detect_format(_opus(1.0)[:64]) == "opus"
+    assert audio.detect_format(b"OggS" + bytes(60)) == "ogg"
+    assert audio.detect_format(b"fLaC") == "flac"
+    assert audio.detect_format(b"ID3\x04") == "mp3"
+    assert audio.detect_format(_adts_frame(6)) == "aac"
+    assert audio.detect_format(b"\xff\xfb\x90\x00") == "mp3"
+    assert audio.detect_format(b"\x00\x00\x00\x18ftypmp42") is None
+
+
+def test_adts_duration_sums_frame_samples():
+    # 24 kHz: 47 frames of 1024 samples plus one frame carrying 2 raw blocks
+    data = _adts_frame(6) * 47 + _adts_frame(6, blocks=2)
+    assert audio._adts_duration(data) == pytest.approx(49 * 1024 / 24000)
+
+
+def test_adts_lost_sync_is_an_error():
+    with pytest.raises(ValueError, match="sync"):
+        audio._adts_duration(_adts_frame(4) + b"\x00" * 10)
+
+
+def test_opus_duration_subtracts_pre_skip():
+    assert audio._opus_duration(_opus(2.5)) == pytest.approx(2.5)
+
+
+def test_probe_reads_headers(tmp_path):
+    aac = tmp_path / "n.aac"
+    aac.write_bytes(_adts_frame(3) * 48)  # 48 kHz
+    assert audio.probe(str(aac)) == audio.AudioInfo("aac", pytest.approx(48 * 1024 / 48000))
+
+    opus = tmp_path / "n.opus"
+    opus.write_bytes(_opus(1.25))
+    assert audio.probe(str(opus)) == audio.AudioInfo("opus", pytest.approx(1.25))
+
+    wav = tmp_path / "n.wav"
+    audio.encode_pcm(bytes(2 * 24000 * 3), 24000, "wav", str(wav))
+    with wave.open(str(wav), "rb") as w:
+        assert w.getframerate() == 24000
+    assert audio.probe(str(wav)) == audio.AudioInfo("wav", pytest.approx(3.0))
+
+
+def test_failed_encode_leaves_no_file(tmp_path):
+    path = tmp_path / "n.aac"
+    with pytest.raises(KeyError):
+        audio.encode_pcm(bytes(100), 24000, "speex", str(path))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_timings_round_trip(tmp_path):
+    path = str(tmp_path / "n.aac")
+    timings = [audio.Timing(0.0, 1.5, "One."), audio.Timing(1.5, 2.75, "Two.")]
+    assert audio.load_timings(path) is None
+    audio.save_timings(path, timings)
+    assert audio.load_timings(path) == timings
+    audio.drop_timings(path)
+    assert audio.load_timings(path) is None
+
+
+def test_mp4_audio_args():
+    assert audio.mp4_audio_args(audio.AudioInfo("opus", 1.0)) == ["-c:a", "copy"]
+    assert audio.mp4_audio_args(audio.AudioInfo("wav", 1.0))[:2] == ["-c:a", "aac"]
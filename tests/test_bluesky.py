@@ -0,0 +1,30 @@
+import re
+
+from scripts.bluesky import _TID_CHARS, record_key
+
+TID = re.compile(r"^[234567abcdefghij][234567abcdefghijklmnopqrstuvwxyz]{12}$")
+
+
+def _decode(tid: str) -> int:
+    n = 0
+    for c in tid:
+        n = n * 32 + _TID_CHARS.index(c)
+    return n
+
+
+def test_record_key_is_a_valid_tid():
+    rkey = record_key("s#1:bluesky", 1_760_000_000.123456)
+    assert TID.match(rkey)
+
+
+def test_record_key_is_stable_per_entry():
+    assert record_key("s#1:bluesky", 1_760_000_000.5) == record_key("s#1:bluesky", 1_760_000_000.5)
+    assert record_key("s#1:bluesky", 1_760_000_000.5) != record_key("s#2:bluesky", 1_760_000_000.5)
+
+
+def test_record_key_encodes_the_creation_time():
+    created_at = 1_760_000_000.123456
+    n = _decode(record_key("s#1:bluesky", created_at))
+    assert n >> 10 == int(created_at * 1_000_000)
+    # later entries sort after earlier ones, as TIDs must
+    assert record_key("a", created_at) < record_key("a", created_at + 0.001)
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pytest
+
+from scripts.daemon import Cron, parse_interval
+
+
+@pytest.mark.parametrize("value, seconds", [("90", 90), ("90s", 90), ("30m", 1800), ("8h", 28800), ("1d", 86400)])
+def test_parse_interval(value, seconds):
+    assert parse_interval(value) == seconds
+
+
+def _next(expr, after):
+    return Cron(expr).next_after(datetime.fromisoformat(after)).isoformat()
+
+
+def test_cron_hours_list():
+    assert _next("7 6,12,18 * * *", "2026-03-01T06:07:00") == "2026-03-01T12:07:00"
+    assert _next("7 6,12,18 * * *", "2026-03-01T18:30:00") == "2026-03-02T06:07:00"
+
+
+def test_cron_steps_and_ranges():
+    assert _next("*/15 * * * *", "2026-03-01T10:01:00") == "2026-03-01T10:15:00"
+    assert _next("0 9-17/4 * * *", "2026-03-01T13:00:00") == "2026-03-01T17:00:00"
+
+
+def test_cron_month_and_year_rollover():
+    assert _next("0 0 1 * *", "2026-12-15T00:00:00") == "2027-01-01T00:00:00"
+    assert _next("0 12 29 2 *", "2026-03-01T00:00:00") == "2028-02-29T12:00:00"
+
+
+def test_cron_weekday_sunday_is_0_and_7():
+    # 2026-03-01 is a Sunday
+    assert _next("0 8 * * 0", "2026-02-27T00:00:00") == "2026-03-01T08:00:00"
+    assert _next("0 8 * * 7", "2026-02-27T00:00:00") == "2026-03-01T08:00:00"
+
+
+def test_cron_restricted_day_and_weekday_match_either():
+    # the 15th or any Monday, whichever comes first
+    assert _next("0 0 15 * 1", "2026-03-03T00:00:00") == "2026-03-09T00:00:00"
+    assert _next("0 0 15 * 1", "2026-03-10T00:00:00") == "2026-03-15T00:00:00"
+
+
+@pytest.mark.parametrize("expr", ["* * * *", "60 * * * *", "* 24 * * *", "0 0 0 * *", "5-1 * * * *"])
+def test_cron_rejects_invalid_expressions(expr):
+    with pytest.raises(ValueError):
+        Cron(expr)
+
+
+def test_cron_that_never_fires():
+    with pytest.raises(ValueError, match="never fires"):
+        Cron("0 0 31 2 *").next_after(datetime(2026, 1, 1))
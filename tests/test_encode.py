@@ -0,0 +1,66 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+from scripts import encode
+
+
+def _noise(w=600, h=800, seed=0) -> Image.Image:
+    # blurred noise compresses badly, and its size spreads widely over the quality range
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8)).filter(ImageFilter.GaussianBlur(2))
+
+
+def test_search_finds_the_highest_quality_within_budget():
+    img = _noise()
+    t = encode.Target("jpeg", 60_000, (600, 800))
+    data, _ = encode._search(img, t, steps=8)
+    assert data is not None and len(data) <= t.max_bytes
+    quality = next(q for q in range(t.max_quality, t.min_quality - 1, -1)
+                   if encode._save(img, t, q) == data)
+    # one step up no longer fits
+    assert len(encode._save(img, t, quality + 1)) > t.max_bytes
+
+
+def test_search_returns_at_once_when_max_quality_fits():
+    img = Image.new("RGB", (100, 100), "white")
+    t = encode.Target("jpeg", 1_000_000, (100, 100))
+    data, smallest = encode._search(img, t, steps=7)
+    assert data == encode._save(img, t, t.max_quality) and smallest is None
+
+
+def test_search_reports_the_smallest_oversize_attempt():
+    t = encode.Target("jpeg", 1_000, (600, 800))
+    data, smallest = encode._search(_noise(), t, steps=7)
+    assert data is None and len(smallest) > t.max_bytes
+
+
+@pytest.mark.parametrize("fmt, magic", [("jpeg", b"\xff\xd8"), ("webp", b"RIFF")])
+def test_encode_bytes_fits_budget_and_box(monkeypatch, fmt, magic):
+    monkeypatch.setenv("IMAGE_TARGETS", f"archive={fmt}:60:400x400")
+    src = _noise(1080, 1920)
+    src.info["exif"] = b"Exif\x00\x00secret"
+    data, mime = encode.encode_bytes(src, "archive")
+    assert mime == encode.MIME[fmt]
+    assert data.startswith(magic) and len(data) <= 60_000
+    assert b"secret" not in data
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.width <= 400 and img.height <= 400
+        assert "exif" not in img.info
+
+
+def test_encode_bytes_shrinks_when_lowest_quality_is_too_large(monkeypatch):
+    monkeypatch.setenv("IMAGE_TARGETS", "archive=jpeg:10:600x800")
+    data, _ = encode.encode_bytes(np.asarray(_noise()), "archive")
+    assert len(data) <= 10_000
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.width < 600
+
+
+def test_encode_file_writes_atomically(tmp_path):
+    out = tmp_path / "thumb.jpg"
+    assert encode.encode_file(_noise(200, 200), "bluesky", str(out)) == str(out)
+    assert out.read_bytes().startswith(b"\xff\xd8")
+    assert [p.name for p in tmp_path.iterdir()] == ["thumb.jpg"]
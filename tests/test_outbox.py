@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from scripts import outbox
+
+
+def _dispatcher(targets, **kwargs):
+    kwargs.setdefault("workers", 2)
+    kwargs.setdefault("max_attempts", 3)
+    kwargs.setdefault("retry_base", 0.05)
+    kwargs.setdefault("drain_timeout", 5)
+    return outbox.Dispatcher(targets, **kwargs)
+
+
+def test_enqueue_is_idempotent():
+    outbox.enqueue("job#1", {"youtube": {"title": "a"}})
+    outbox.enqueue("job#1", {"youtube": {"title": "b"}})
+    assert outbox.counts() == {"pending": 1}
+    assert outbox.get_entry("job#1:youtube")["payload"] == {"title": "a"}
+
+
+def test_claimed_entry_is_not_claimed_twice():
+    outbox.enqueue("job#1", {"bluesky": {}, "youtube": {}})
+    first = outbox.claim_due(10, {"youtube": None})
+    assert [e["id"] for e in first] == ["job#1:youtube"]
+    assert outbox.claim_due(10, {"youtube": None}) == []
+    assert [e["id"] for e in outbox.claim_due(10)] == ["job#1:bluesky"]
+
+
+def test_failures_back_off_then_fail_and_rearm():
+    outbox.enqueue("job#1", {"youtube": {}})
+    entry = outbox.claim_due(1)[0]
+    outbox._record(entry, None, "boom", max_attempts=2, retry_base=60)
+    entry = outbox.get_entry(entry["id"])
+    assert entry["status"] == "pending" and entry["attempts"] == 1
+    assert entry["next_attempt_at"] > time.time() + 50
+    assert outbox.claim_due(1) == []
+
+    outbox._record(entry, None, "boom", max_attempts=2, retry_base=60)
+    assert outbox.get_entry(entry["id"])["status"] == "failed"
+    # enqueueing the job again leaves a failed entry alone; only rearm retries it
+    outbox.enqueue("job#1", {"youtube": {}})
+    assert outbox.counts() == {"failed": 1}
+    assert outbox.rearm() == 1
+    entry = outbox.get_entry(entry["id"])
+    assert entry["status"] == "pending" and entry["attempts"] == 0
+
+
+def test_dispatcher_retries_until_delivered():
+    calls = []
+
+    def deliver(entry):
+        calls.append(entry["attempts"])
+        if len(calls) == 1:
+            raise RuntimeError("flaky")
+        return "video-id"
+
+    with _dispatcher({"youtube": deliver}):
+        outbox.enqueue("job#1", {"youtube": {}})
+    entry = outbox.get_entry("job#1:youtube")
+    assert entry["status"] == "done" and entry["result"] == "video-id"
+    assert calls == [0, 1]
+
+
+def test_dispatcher_survives_a_failing_pass(monkeypatch):
+    claim_due, failures = outbox.claim_due, []
+
+    def locked_once(*args):
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        return claim_due(*args)
+
+    monkeypatch.setattr(outbox, "claim_due", locked_once)
+    delivered = threading.Event()
+    with _dispatcher({"bluesky": lambda entry: delivered.set() or "at://post"}) as dispatcher:
+        outbox.enqueue("job#1", {"bluesky": {}})
+        assert delivered.wait(10)
+        assert dispatcher.alive()
+        assert "database is locked" in dispatcher.error
+    assert outbox.counts() == {"done": 1}
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_close_reports_a_dead_dispatcher(monkeypatch):
+    dispatcher = _dispatcher({})
+
+    def die():
+        raise SystemExit
+
+    monkeypatch.setattr(dispatcher, "_pass", die)
+    dispatcher.__enter__()
+    dispatcher._thread.join(5)
+    assert not dispatcher.alive()
+    with pytest.raises(RuntimeError, match="stopped unexpectedly"):
+        dispatcher.close()
@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+import time
+
+from scripts import state
+
+
+def _series(key="s", parts=3):
+    state.ensure_series(key, "seed", "story", parts)
+
+
+def test_claim_advance_until_finished():
+    _series(parts=2)
+    assert state.claim_next_part("s") == 1
+    state.advance_series("s")
+    assert state.claim_next_part("s") == 2
+    state.advance_series("s")
+    assert state.claim_next_part("s") is None
+    assert state.get_series("s")["next_part"] == 3
+
+
+def test_claim_is_exclusive_until_released():
+    _series()
+    assert state.claim_next_part("s") == 1
+    assert state.claim_next_part("s") is None
+    assert state.peek_next_part("s") is None
+    state.release_series("s")
+    assert state.peek_next_part("s") == 1
+    assert state.claim_next_part("s") == 1
+
+
+def test_expired_claim_is_retried():
+    _series()
+    assert state.claim_next_part("s", ttl=0.05) == 1
+    assert state.claim_next_part("s") is None
+    time.sleep(0.1)
+    assert state.claim_next_part("s") == 1
+    assert state.get_series("s")["next_part"] == 1
+
+
+def test_advance_drops_prefetched_scripts_of_produced_parts():
+    _series()
+    state.store_prefetch("s", {1: "one", 2: "two"})
+    state.claim_next_part("s")
+    state.advance_series("s")
+    assert state.get_prefetch("s", 1) is None
+    assert state.get_prefetch("s", 2) == "two"
+
+
+def test_threads_opening_a_fresh_database_at_once():
+    errors, claims = [], []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        try:
+            barrier.wait()
+            state.ensure_series("s", "seed", "story", 3)
+            claims.append(state.claim_next_part("s"))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    # exactly one worker got the part, the others saw the claim
+    assert claims.count(1) == 1 and claims.count(None) == 7
+    assert state.connect().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def _write_legacy(series):
+    os.makedirs("state", exist_ok=True)
+    with open(state.LEGACY_JSON_PATH, "w", encoding="utf-8") as f:
+        json.dump({"series": series}, f)
+
+
+def test_legacy_json_is_imported_once():
+    _write_legacy({"a": {"seed": "x", "mode": "story", "next_part": 4, "parts_per_series": 8}})
+    assert state.get_series("a")["next_part"] == 4
+
+    # a later process (fresh setup, new thread) must not import the file again
+    _write_legacy({
+        "a": {"seed": "x", "mode": "story", "next_part": 4, "parts_per_series": 8},
+        "b": {"seed": "y", "mode": "story", "next_part": 2, "parts_per_series": 8},
+    })
+    state._set_up.discard(state.db_path())
+    seen = []
+    t = threading.Thread(target=lambda: seen.append(state.get_series("b")))
+    t.start()
+    t.join()
+    assert seen == [None]
+
+
+def test_unreadable_legacy_json_is_left_alone():
+    os.makedirs("state", exist_ok=True)
+    with open(state.LEGACY_JSON_PATH, "w", encoding="utf-8") as f:
+        f.write("{not json")
+    assert state.get_series("a") is None
+    with open(state.LEGACY_JSON_PATH, encoding="utf-8") as f:
+        assert f.read() == "{not json"
+
+
+def test_read_only_without_database_creates_nothing():
+    _write_legacy({"a": {"seed": "x", "mode": "story", "next_part": 4, "parts_per_series": 8}})
+    state.set_read_only()
+    assert state.peek_next_part("a") == 4
+    assert not os.path.exists(state.db_path())